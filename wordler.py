@@ -197,15 +197,15 @@
 #     incoming_guesses : TreeSet(Guess)
 #     remaining candidates : BloomFilter  # 290 bytes
 #     alternative_next_guesses : TreeSet(Guess)  # this could be in the State class
-#     prob_success : float
-#     average_remaining_guesses : float
+#     wins : (int, int)  # bounds on the number of remaining candidates won; prob_success is wins / #candidates
+#     total_guesses : (int, int)  # average_remaining_guesses is total_guesses / wins
 #
 #
 # class Guess
 #     word : twoByteInt
 #     prevState : State
-#     prob_success : float
-#     average_remaining_guesses : float
+#     wins : (int, int)  # out of the remaining candidates of prevState
+#     total_guesses : (int, int)  # average_remaining_guesses is total_guesses / wins
 #     next_states : dict  # State -> TreeSet(twoByteInt)   # the States resulting from applying this Guess to the previous State mapped to the set of solutions that lead to the State, the size of which is proportional to the likelihood of arriving in the State
 #
 # queue: TreeSet(State)  # order by number of prior guesses and prob_success
@@ -230,7 +230,7 @@
 #     - Since more than one solution could map to the same State, keep track
 #       of which belong to which node or at least count them since that
 #       corresponds to the likelihood of reaching the node
-#   - update State's prob_success and average_remaining_guesses
+#   - update State's wins and total_guesses
 #   - update incoming_guesses to the State and propagate backward
 #   - if need to explore more Guesses, add this State back in queue
 #   - Compute the next_states to the queue
@@ -291,15 +291,31 @@
 #
 #
 import os
+import sys
 import queue
 import heapq
 import random
+import math
+import multiprocessing
 import json
 import time
 from time import process_time
 from typing import Set, Any
 import pickle
-from zipfile import ZipFile
+import hashlib
+import tempfile
+import shutil
+import tracemalloc
+import threading
+import contextlib
+import zlib
+import mmap
+from array import array
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import http.client
+from functools import cmp_to_key
+from itertools import accumulate
 
 random.seed(333)
 
@@ -308,15 +324,23 @@ debug = False  # whether to print out details for debugging
 optimize_for_winning = True  # find best policy for always winning
 minimize_guesses = True      # find the policy that minimizes the average number of guesses
 compute_num_guesses = True   # Whether to compute the average number of guesses.  This is made True if minimize_guesses == True
+hard_mode = True  # whether guesses must be consistent with the feedback so far; in easy mode, any solution (or herring if use_herrings) can be guessed
 
 wordle_solutions = []  # word strings read from file
 wordle_herrings = []  # word strings read from file
+use_herrings = False  # whether to also guess the herrings, words that are accepted as guesses but are never solutions
+max_herring_guesses = 100  # the number of herrings (ranked by how many sets they split the solutions into) tried for a State
 guess_candidates = []  # this could be wordle_solutions or the union of wordle_solutions and wordle_herrings
-word_indices = {}  # string -> int
+word_indices = {}  # string -> int; the index of a solution is the same in wordle_solutions and guess_candidates
 remaining_candidates = []  # remaining_candidates[solution][guess] = remaining candidate set as bloom filter
+feedback_codes = []  # feedback_codes[guess][solution] = feedback_code() as a byte; only computed when use_herrings
+letter_position_masks = []  # letter_position_masks[i][letter] = bloom filter of the guess candidates with the letter at position i
+letter_count_masks = {}  # letter_count_masks[letter][k] = bloom filter of the guess candidates with at least k copies of the letter
 all_guess_candidates = 0  # this is the bloom filter int representing the set of all, a binary 1 for each word.
 all_solution_candidates = 0  # the bloom filter for just the solution candidates
 init_state = None  # this is the root of the search tree
+cache_dir = 'wordler_cache'  # tables computed for word lists are kept in a subdirectory for each, named by word_list_key()
+feedback_rules_version = 2  # part of word_list_key(); version 2 fixed the rules for repeated letters
 tl_start = 0  # initial cpu time marker; compute cpu time since tl_start was set with process_time() - tl_start
 
 
@@ -331,8 +355,12 @@ with open('wordle_herrings.txt') as f:
     wordle_herrings = wordle_herrings
 
 
-def init_globals():
-    """ This computes the remaining_candidates matrix. """
+def init_globals(patch_from: tuple = None):
+    """
+    This computes the remaining_candidates matrix.
+    :param patch_from: (old solutions, old remaining_candidates) to patch the matrix from when the solutions changed,
+    instead of computing it from scratch; see update_word_list()
+    """
     global guess_candidates
     global word_indices
     global all_solution_candidates
@@ -342,19 +370,27 @@ def init_globals():
     # global all_candidates
 
     # guess candidates can be restricted to solutions or solutions + herrings
-    guess_candidates = wordle_solutions
-    #guess_candidates = wordle_solutions + wordle_herrings
+    # The solutions come first so that a word's index is the same as a solution and as a guess.  The bloom filters
+    # of remaining candidates then have the solutions in the low bits and the herrings consistent with the feedback
+    # so far (allowed guesses in hard mode) in the high bits.
+    guess_candidates = wordle_solutions + wordle_herrings if use_herrings else wordle_solutions
 
     # TODO -- reorder wordle solutions and herrings according to a heuristic for best guess
 
-    word_indices = {wordle_solutions[i]: i for i in range(len(wordle_solutions))}
+    word_indices = {guess_candidates[i]: i for i in range(len(guess_candidates))}
 
     all_solution_candidates = 2 ** len(wordle_solutions) - 1
     all_guess_candidates = 2 ** len(guess_candidates) - 1
 
     tl_start = process_time()
 
-    rem_cand_filename = "remaining_candidates_" + str(len(wordle_solutions)) + ".bin"
+    init_letter_masks()
+    if use_herrings:
+        init_feedback_codes()
+
+    # The file is named by a hash of the solutions and the feedback rules, so another word list, even of the same
+    # length, has its own file.
+    rem_cand_filename = cache_path("remaining_candidates.bin", wordle_solutions)
     remaining_candidates = read_remaining_candidates_from_file(rem_cand_filename)
     if remaining_candidates is None or len(remaining_candidates) != len(wordle_solutions):
         print("Computing remaining_candidates matrix")
@@ -364,24 +400,23 @@ def init_globals():
         return
 
     # Compute remaining_candidates[solution][guess] = remaining candidate set as bloom filter
+    # Only solutions are guessed here; partitions for herrings come from feedback_codes.
     # First allocate the big matrix
-    remaining_candidates = [[all_solution_candidates for x in wordle_solutions] for y in guess_candidates]
+    remaining_candidates = [[all_solution_candidates for x in wordle_solutions] for y in wordle_solutions]
     #remaining_candidates = pandas.array(remaining_candidates)
-    # Now compute each set in the matrix
-
-    for sol_i in range( len(wordle_solutions) ):
-        solution = wordle_solutions[ sol_i ]
-        for guess_i in range( len(guess_candidates) ):
-            guess = guess_candidates[ guess_i ]
-            if sol_i == guess_i:
-                remaining_candidates[sol_i][guess_i] = 2 ** sol_i
-            else:
-                remaining_set = compute_remaining_candidates(solution, guess)
-                # add_time = process_time() - tl_start
-                # print( "seconds for computing " + solution + "-" + guess + " is " + str( add_time ) )
-                remaining_candidates[sol_i][guess_i] = remaining_set
-        add_time = process_time() - tl_start
-        print( "seconds elapsed after computing sets for word #" + str(sol_i) + " (" + solution + ") is " + str( add_time ) )
+    # Now compute each set in the matrix.
+
+    patch = patch_matrix_columns(*patch_from) if patch_from else None
+    for guess_i in range( len(wordle_solutions) ):
+        guess = wordle_solutions[ guess_i ]
+        if patch:
+            patch(guess_i)
+        else:
+            compute_matrix_column(guess_i, range(len(wordle_solutions)))
+        if guess_i % 500 == 0:
+            add_time = process_time() - tl_start
+            print( "seconds elapsed after computing sets for guess #" + str(guess_i) + " (" + guess + ") is " + str( add_time ) )
+    add_time = process_time() - tl_start
 
     print("writing out remaining_candidates to file to load next time and avoid recomputing")
     write_remaining_candidates(rem_cand_filename)
@@ -391,97 +426,258 @@ def init_globals():
 
     #print( "size of remaining_candidates = " + str(sys.getsizeof(remaining_candidates)))  # this doesn't do what you want
 
+def compute_matrix_column(guess_i: int, solution_indices):
+    """
+    Compute remaining_candidates[solution][guess] for the solutions.  The solutions that get the same feedback for
+    the guess share the same set, so the masks are only ANDed once for each feedback (at most 243) of the guess.
+    """
+    guess = wordle_solutions[guess_i]
+    sets = {}  # feedback code -> remaining candidate set
+    for sol_i in solution_indices:
+        code = feedback_code(guess, wordle_solutions[sol_i])
+        remaining_set = sets.get(code)
+        if remaining_set is None:
+            remaining_set = feedback_mask(guess, code) & all_solution_candidates
+            sets[code] = remaining_set
+        remaining_candidates[sol_i][guess_i] = remaining_set
+
+def patch_matrix_columns(old_solutions: list, old_matrix: list):
+    """
+    Make a function that fills a column of remaining_candidates from the matrix of the old solutions, as ordered by
+    update_word_list(): the kept solutions in their old order followed by the new ones.  A kept guess and solution
+    get the old set with the dropped solutions removed and the new solutions with the same feedback added, so each
+    distinct old set of the column is only converted once.  The new guesses and solutions are computed from scratch.
+    :return: a function of the index of a guess
+    """
+    old_indices = {old_solutions[i]: i for i in range(len(old_solutions))}
+    num_kept = 0
+    while num_kept < len(wordle_solutions) and wordle_solutions[num_kept] in old_indices:
+        num_kept += 1
+    kept_old_indices = [old_indices[word] for word in wordle_solutions[:num_kept]]
+    dropped = dropped_indices(old_solutions)
+    new_candidates = all_solution_candidates & ~((1 << num_kept) - 1)
+
+    def patch_column(guess_i: int):
+        guess = wordle_solutions[guess_i]
+        if guess_i >= num_kept:
+            compute_matrix_column(guess_i, range(len(wordle_solutions)))
+            return
+        old_guess_i = old_indices[guess]
+        converted = {}  # old set -> new set
+        for sol_i in range(num_kept):
+            old_set = old_matrix[kept_old_indices[sol_i]][old_guess_i]
+            remaining_set = converted.get(old_set)
+            if remaining_set is None:
+                remaining_set = drop_candidates(old_set, dropped)
+                if new_candidates:
+                    remaining_set |= feedback_mask(guess, feedback_code(guess, wordle_solutions[sol_i])) & new_candidates
+                converted[old_set] = remaining_set
+            remaining_candidates[sol_i][guess_i] = remaining_set
+        compute_matrix_column(guess_i, range(num_kept, len(wordle_solutions)))
+
+    return patch_column
+
+def dropped_indices(old_solutions: list):
+    """ The indices of the old solutions that are no longer solutions, highest first for drop_candidates() """
+    solutions = set(wordle_solutions)
+    return [i for i in range(len(old_solutions) - 1, -1, -1) if old_solutions[i] not in solutions]
+
+def drop_candidates(cands: int, dropped: list) -> int:
+    """
+    Remove the bits of the dropped indices from a bloom filter of the old solutions, shifting the higher bits down so
+    that it indexes the kept solutions in the same order.
+    :param dropped: indices from dropped_indices(), highest first
+    """
+    for i in dropped:
+        cands = (cands & ((1 << i) - 1)) | ((cands >> (i + 1)) << i)
+    return cands
+
 def compute_remaining_candidates(solution, guess):
-    match_indices = set()  # the indices labeled green  # mi.copy()
-    letters_in_wrong_place = set()  # the indices labeled yellow  # liwp.copy()
-    min_numbers_of_letters = {}
-    unmatched_letters = set()
+    """
+    Compute the set of solutions that would get the same feedback as the solution for the guess.  A word gets the
+    same feedback if it matches the solution where the guess matched exactly, doesn't match the guess anywhere else,
+    and has the same number of each letter in the guess up to the count in the guess.  The last rule covers letters
+    in the wrong place, letters not in the solution, and repeated letters that the solution has fewer of.  Rather
+    than rescanning every word, feedback_mask() ANDs a few precomputed masks.
+    """
+    return feedback_mask(guess, feedback_code(guess, solution)) & all_solution_candidates
+
+def init_letter_masks():
+    """
+    Compute letter_position_masks and letter_count_masks over guess_candidates.  These turn any feedback into the set
+    of consistent words with a handful of ANDs in feedback_mask(), so new word lists, herring guesses and ad hoc
+    queries don't need the remaining_candidates matrix.
+    """
+    global letter_position_masks
+    global letter_count_masks
+    letter_position_masks = [{} for i in range(5)]
+    letter_count_masks = {}
+    for word_i in range(len(guess_candidates)):
+        word = guess_candidates[word_i]
+        bit = 1 << word_i
+        for i in range(5):
+            letter_position_masks[i][word[i]] = letter_position_masks[i].get(word[i], 0) | bit
+        for letter in set(word):
+            counts = letter_count_masks.get(letter)
+            if counts is None:
+                counts = [all_guess_candidates, 0, 0, 0, 0, 0]  # everything has at least zero copies
+                letter_count_masks[letter] = counts
+            for k in range(1, word.count(letter) + 1):
+                counts[k] |= bit
+
+def feedback_mask(guess: str, code: int) -> int:
+    """
+    The guess candidates that would get the feedback for the guess, as a bloom filter.  Greens require the letter at
+    the position, and yellows and grays forbid it.  The greens and yellows of a letter require at least that many
+    copies, and a gray of the letter makes it exactly that many.
+    :param guess: the guessed word, which doesn't need to be a guess candidate
+    :param code: the feedback as computed by feedback_code()
+    """
+    mask = all_guess_candidates
+    found = {}  # letter -> number of greens and yellows
+    grays = set()
+    for i in range(4, -1, -1):
+        (code, digit) = divmod(code, 3)
+        letter = guess[i]
+        position_mask = letter_position_masks[i].get(letter, 0)
+        if digit == 2:
+            mask &= position_mask
+        else:
+            mask &= ~position_mask
+        if digit > 0:
+            found[letter] = found.get(letter, 0) + 1
+        else:
+            grays.add(letter)
+    for letter in set(guess):
+        counts = letter_count_masks.get(letter, [all_guess_candidates, 0, 0, 0, 0, 0])
+        k = found.get(letter, 0)
+        mask &= counts[k]
+        if letter in grays:
+            mask &= ~counts[k + 1]
+    return mask
+
+def consistent_candidates(feedback: list):
+    """
+    Answer an ad hoc query without the remaining_candidates matrix.  This assumes init_globals() has been called.
+    :param feedback: a list of (guessed word, feedback code from feedback_code())
+    :return: the list of guess candidates consistent with all of the feedback
+    """
+    mask = all_guess_candidates
+    for (guess, code) in feedback:
+        mask &= feedback_mask(guess, code)
+    return [guess_candidates[i] for i in candidate_indices(mask)]
 
-    # evaluate letters in wrong guess against the solution
-    solution_no_matches = solution
+def feedback_code(guess: str, solution: str) -> int:
+    """
+    The wordle feedback for the guess as a base 3 number with a digit for each letter, most significant first: 2 for
+    green, 1 for yellow, and 0 for gray.  Two solutions get the same code exactly when
+    compute_remaining_candidates() puts them in the same set.  All green is 242.
+    """
+    digits = [0, 0, 0, 0, 0]
+    unmatched = {}  # the number of each letter of the solution not matched by a green
     for i in range(5):
         if guess[i] == solution[i]:
-            match_indices.add(i)
-            solution_no_matches = solution_no_matches[:i] + ' ' + solution_no_matches[i + 1:]
-    counts = {letter: solution_no_matches.count(letter) for letter in set(solution_no_matches)}
+            digits[i] = 2
+        else:
+            unmatched[solution[i]] = unmatched.get(solution[i], 0) + 1
     for i in range(5):
-        if i not in match_indices:
-            if guess[i] in solution:
-                if guess[i] in solution_no_matches and counts[guess[i]] > 0:
-                    letters_in_wrong_place.add(i)
-                    counts[guess[i]] -= 1
-            else:
-                unmatched_letters.add(guess[i])
-    for letter in set(guess):
-        min_numbers_of_letters[letter] = min(solution.count(letter), guess.count(letter))
-
-    # Determine possible next guesses
-    unmatched_indices = set(range(5)) - match_indices - letters_in_wrong_place
-    remaining_set = 0
-    mask = 1
-    for s_i in range(len(wordle_solutions)):
-        w = wordle_solutions[s_i]  # getting the actual string for the word
-
-        # letters must match where we found the exact matching letters
-        matches_positions = True
-        for m in match_indices:
-            if w[m] != solution[m]:
-                matches_positions = False
-                break
-        if not matches_positions:
-            continue
+        if digits[i] == 0 and unmatched.get(guess[i], 0) > 0:
+            digits[i] = 1
+            unmatched[guess[i]] -= 1
+    return (((digits[0] * 3 + digits[1]) * 3 + digits[2]) * 3 + digits[3]) * 3 + digits[4]
 
-        # If the letter in position i was unmatched or in wrong position w[i] must not equal guess[i]
-        matched_unmatched_position = False
-        for z in unmatched_indices:
-            if w[z] == guess[z]:
-                matched_unmatched_position = True
-                break
-        if matched_unmatched_position:
-            continue
+def word_list_key(*word_lists) -> str:
+    """ A hash of the word lists (in order) and the feedback rules that identifies the tables computed for them """
+    h = hashlib.sha256(json.dumps([feedback_rules_version] + list(word_lists)).encode())
+    return h.hexdigest()[:16]
 
-        # For letters found in the wrong position,
-        # (1) the letter can't be in the same wrong position again,
-        # (2) the number of letters found in the wrong position must be consistent
-        has_all_letters = True
-        for i in letters_in_wrong_place:
-            if w[i] == guess[i] or \
-                    min_numbers_of_letters[guess[i]] > w.count(guess[i]):
-                has_all_letters = False
-                break
-        if not has_all_letters:
-            continue
+def guess_word_lists():
+    """ The word lists that the guesses come from: the solutions, and the herrings if they are guessed """
+    return [wordle_solutions, wordle_herrings] if use_herrings else [wordle_solutions]
 
-        # Make sure the candidate has no letters for which we found no matches
-        no_forbidden_letters = True
-        for u in unmatched_letters:
-            if u in w:
-                no_forbidden_letters = False
-                break
-        if not no_forbidden_letters:
-            continue
+def cache_path(name: str, *word_lists) -> str:
+    """
+    The file for a table computed for the word lists.  Each combination of word lists gets its own subdirectory of
+    cache_dir, so the tables of several dictionaries are kept side by side, and only the files that a run needs are
+    read.  The word lists are also written to words.json in the subdirectory to tell which dictionary it is for.
+    """
+    key = word_list_key(*word_lists)
+    directory = os.path.join(cache_dir, key)
+    if not os.path.exists(os.path.join(directory, "words.json")):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "words.json"), 'w') as f:
+            json.dump({'key': key, 'feedback_rules_version': feedback_rules_version, 'word_lists': list(word_lists)}, f)
+    return os.path.join(directory, name)
+
+def write_cached(fn: str, key: str, obj):
+    """
+    Pickle the object to the file along with the word_list_key() that it was computed for.  It is written to a
+    temporary file first so that a crash doesn't leave a partly written file.
+    """
+    with open(fn + '.tmp', 'wb') as f:
+        pickle.dump((key, obj), f)
+    os.replace(fn + '.tmp', fn)
 
-        # set the bit for the possible candidate in the bloom filter
-        remaining_set |= 2 ** s_i
+def read_cached(fn: str, key: str):
+    """
+    Read an object written by write_cached(), validating that it was computed for the same word lists.
+    :return: the object, or None if the file doesn't exist or is for other word lists
+    """
+    try:
+        with open(fn, 'rb') as f:
+            (file_key, obj) = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(fn + ' could not be read')
+        print(str(e))
+        return None
+    if file_key != key:
+        print(fn + ' is for other word lists (' + str(file_key) + ' instead of ' + key + ')')
+        return None
+    return obj
 
-    return remaining_set
+def feedback_codes_filename():
+    return cache_path("feedback_codes.bin", *guess_word_lists())
 
+def init_feedback_codes():
+    """
+    Read or compute feedback_codes, a byte for each guess and solution.  This is the compact form of the solution x
+    guess matrix for the herrings: 12,972 x 2,315 bytes is about 30MB, where bloom filters would take gigabytes.
+    """
+    global feedback_codes
+    fn = feedback_codes_filename()
+    key = word_list_key(*guess_word_lists()).encode()  # the file starts with the key to validate it
+    n = len(wordle_solutions)
+    try:
+        with open(fn, 'rb') as f:
+            data = f.read()
+        if data.startswith(key) and len(data) == len(key) + n * len(guess_candidates):
+            data = data[len(key):]
+            feedback_codes = [data[i * n:(i + 1) * n] for i in range(len(guess_candidates))]
+            return
+        print(fn + ' is for other word lists or truncated')
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(fn + ' could not be read')
+        print(str(e))
+    print("Computing feedback codes for " + str(len(guess_candidates)) + " guesses")
+    tl = process_time()
+    feedback_codes = [bytes([feedback_code(guess, solution) for solution in wordle_solutions]) for guess in guess_candidates]
+    print("seconds elapsed computing feedback codes is " + str(process_time() - tl))
+    with open(fn, 'wb') as f:
+        f.write(key)
+        for codes in feedback_codes:
+            f.write(codes)
 
 def write_remaining_candidates(fn='remaining_candidates.bin'):
     """ Write the matrix to file so that we don't have to spend hours recomputing it! """
-    with open(fn, 'wb') as f:
-        pickle.dump(remaining_candidates, f)
+    write_cached(fn, word_list_key(wordle_solutions), remaining_candidates)
 
 def read_remaining_candidates_from_file(fn='remaining_candidates.bin'):
-    """ Read the matrix to file so that we don't have to spend hours recomputing it! """
-    cands = None
-    try:
-        f = open(fn, 'rb')
-        cands = pickle.load(f)
-    except Exception as e:
-        print(fn + ' not found or pickle.load() failed')
-        print(str(e))
-    return cands
+    """ Read the matrix from file if it was computed for the same solutions so that we don't have to recompute it! """
+    return read_cached(fn, word_list_key(wordle_solutions))
 
 
 import dill
@@ -513,6 +709,11 @@ class State:
     """ A search state for the remaining possible candidate after a particular number of guesses. """
 
     alternative_next_guesses: Set[ Any ]  # Set[ Guess ]
+    wins_bounds = None  # (min, max) wins known from other depths or initial_bounds(); see seed_from_other_depths()
+    guess_options = None  # the list from get_guess_options() when guessing herrings
+    dirty = False  # whether the State or its guesses changed since the last checkpoint; see mark_dirty()
+    lazy = None  # (checkpoint record, row) to build the guesses from when the State was loaded lazily; see materialize()
+    feedback_index = None  # the guesses of the State indexed by word and feedback code for next_guess(); see feedback_index()
 
     def __init__(self):
         # self.prior_state: State = None   # consider instead to look up the state in a set by prior guesses (or number of guesses) and remaining candidates
@@ -521,18 +722,34 @@ class State:
         self.remaining_candidates: int = 0  # BloomFilter as int # 290 bytes
         self.num_remaining_candidates: int = 0  # so we don't have to call num_ones_in_bits() all the time
         self.alternative_next_guesses: list = []  # priority queue
-        self.prob_success = (0.0, 1.0)  # (min, max) probability;  based on our partially solved policy, we know that the optimal policy has a win success probability within these bounds.
-        self.average_remaining_guesses = (1.0, 6.0)  # (min, max) expected number of guesses, just for the cases where
-                                                     # there is a win.  So, a bad first guess (with lower probability of
-                                                     # success) could have a smaller average number of guesses.
-                                                     # Thus, when combining stats, the average number of guesses is weighted by prob_success.
-        if compute_num_guesses and not optimize_for_winning:
-            self.average_remaining_guesses = (self.average_remaining_guesses[0], len(wordle_solutions) / 2.0)
+        self.wins = (0, 0)  # (min, max) number of remaining candidates won;  based on our partially solved policy, we know that the optimal policy wins a number within these bounds.
+                            # Counting wins instead of using probabilities keeps the arithmetic exact.  The max is
+                            # set to the number of remaining candidates when the State is initialized.
+        self.total_guesses = (0, 0)  # (min, max) total number of guesses, just for the cases where there is a win.
+                                     # The expected number of guesses is (total_guesses[0] / wins[1], total_guesses[1] / wins[0]).
+                                     # So, a bad first guess (with lower probability of success) could have a smaller
+                                     # average number of guesses.  Thus, when combining stats, the average number of guesses
+                                     # is weighted by wins, which is just adding up the totals.
+
+    @property
+    def prob_success(self):
+        """ The (min, max) probability of winning as floats for display; comparisons should use wins. """
+        n = self.num_outcomes()
+        return (self.wins[0] / n, self.wins[1] / n)
+
+    @property
+    def average_remaining_guesses(self):
+        """ The (min, max) expected number of guesses as floats for display; comparisons should use cmp_avg(). """
+        return average_guesses(self)
+
+    def num_outcomes(self):
+        """ The denominator of wins, the number of remaining candidates, or 1 for the State of a win. """
+        return max(1, self.get_num_remaining_candidates())
 
     def serialize(self):
         """ A writable representation of the State for rebuilding the policy """
-        arr = [self.num_prior_guesses, self.remaining_candidates, self.prob_success, self.average_remaining_guesses,
-               [[g.word, g.prob_success, g.average_remaining_guesses,
+        arr = [self.num_prior_guesses, self.remaining_candidates, self.wins, self.total_guesses,
+               [[g.word, g.wins, g.total_guesses,
                  [(n, s.remaining_candidates) for (s,n) in g.next_states.items()]]
                 for g in self.alternative_next_guesses]]
         return arr
@@ -541,8 +758,10 @@ class State:
         """ Populate members from an array serialization """
         self.num_prior_guesses = arr[0]
         self.remaining_candidates = arr[1]
-        self.prob_success = arr[2]
-        self.average_remaining_guesses = arr[3]
+        self.wins = arr[2]
+        self.total_guesses = arr[3]
+        for g in self.alternative_next_guesses:
+            collapse_guess(g)  # a State read again replaces its guesses
         self.alternative_next_guesses = self.alternative_next_guesses_from(arr[4])
 
     def alternative_next_guesses_from(self, arr: list):
@@ -557,7 +776,7 @@ class State:
     def get_num_remaining_candidates(self):
         """
         Compute once and remember the result of computing the number of words in the remaing_candidates integer
-        (the number of binary 1s)
+        (the number of binary 1s), not counting herrings since they can't be the solution
 
         :return: the number of remaining candidates
         """
@@ -565,9 +784,24 @@ class State:
             return self.num_remaining_candidates
         if self.remaining_candidates == 0:
             return 0
-        self.num_remaining_candidates = num_ones_in_bits(self.remaining_candidates)
+        self.num_remaining_candidates = num_solutions(self.remaining_candidates)
         return self.num_remaining_candidates
 
+    def get_guess_options(self):
+        """
+        The word indices that may be guessed from this State, computed once: the remaining solution candidates
+        followed by the best herrings from herring_guess_options().
+        """
+        if self.guess_options is None:
+            self.guess_options = list(guess_indices(self.remaining_candidates))
+        return self.guess_options
+
+    def get_num_guess_options(self):
+        """ The number of alternative guesses to add before the State is fully expanded """
+        if hard_mode and not use_herrings:
+            return self.get_num_remaining_candidates()
+        return len(self.get_guess_options())
+
     def choose_next_guess( self ):
         """
         Choose the next guess alternative to add to the state.  This is used as
@@ -584,8 +818,11 @@ class State:
         computing with respect to the remaining candidates.
         """
         g = Guess()
-        g.word = nth_candidate(len(self.alternative_next_guesses) + 1,
-                               self.remaining_candidates )
+        if use_herrings or not hard_mode:
+            g.word = self.get_guess_options()[len(self.alternative_next_guesses)]
+        else:
+            g.word = nth_candidate(len(self.alternative_next_guesses) + 1,
+                                   self.remaining_candidates )
         g.prev_state = self
         return g
 
@@ -756,24 +993,35 @@ class Guess:
         else:
             self.word: int = 0
             self.prev_state: State = None  # State or the (num_guesses, remaining_candidates) index
-            self.prob_success: tuple = (0.0, 1.0)
-            self.average_remaining_guesses: tuple = (1.0, 6.0)
+            self.wins: tuple = (0, 0)  # (min, max) out of the remaining candidates of prev_state
+            self.total_guesses: tuple = (0, 0)  # the number of guesses after this one over the wins, (min, max) over (wins[1], wins[0])
             self.next_states = {}  # State -> int  # the States resulting from applying this Guess to the previous State mapped to a count of solutions that lead to the State, which is proportional to the likelihood of arriving in the State
 
     def deserialize(self, arr):
         """ Populate the members of the input Guess based on the input array in the format used by deserialize_state() """
         self.word: int = arr[0] if arr else 0
         self.prev_state: State = arr[1] if arr else None
-        self.prob_success: tuple = arr[2] if arr else (0.0, 1.0)
-        self.average_remaining_guesses: tuple = arr[3] if arr else (1.0, 6.0)
+        self.wins: tuple = arr[2] if arr else (0, 0)
+        self.total_guesses: tuple = arr[3] if arr else (0, 0)
         self.next_states = next_states_from(self.prev_state.num_prior_guesses + 1, arr[4])  # State -> int  # the States resulting from applying this Guess to the previous State mapped to a count of solutions that lead to the State, which is proportional to the likelihood of arriving in the State
         for s in self.next_states.keys():
             s.incoming_guesses.append(self)
 
+    @property
+    def prob_success(self):
+        """ The (min, max) probability of winning as floats for display; comparisons should use wins. """
+        n = self.prev_state.num_outcomes()
+        return (self.wins[0] / n, self.wins[1] / n)
+
+    @property
+    def average_remaining_guesses(self):
+        """ The (min, max) expected number of remaining guesses as floats for display; comparisons should use cmp_avg(). """
+        return average_guesses(self)
+
     def __str__(self):
         """ A string representation of the Guess """
         s = ("%d (%s) p=(%.8g,%.8g) ang=(%.8g,%.8g) prev state=(num guesses=%d,rem cands=%d)" %
-             (self.word, wordle_solutions[self.word], *self.prob_success, *self.average_remaining_guesses,
+             (self.word, guess_candidates[self.word], *self.prob_success, *self.average_remaining_guesses,
               self.prev_state.num_prior_guesses, self.prev_state.remaining_candidates))
         return s
 
@@ -786,16 +1034,15 @@ class Guess:
 
     def update_prob_success(self):
         """
-        Simply calculate the probability of success based on that of the next states weighted by probability,
-        which is just the count of solutions that would transition to each state since each solution is equally likely.
+        Simply calculate the wins based on those of the next states.  The count of solutions that transition to each
+        state is the number of its remaining candidates (or 1 for the win), so the wins just add up.
         """
-        num_child_states = sum(self.next_states.values())
-        min_prob = sum([s.prob_success[0] * n for (s, n) in self.next_states.items()]) / num_child_states
-        max_prob = sum([s.prob_success[1] * n for (s, n) in self.next_states.items()]) / num_child_states
+        min_wins = sum([s.wins[0] for s in self.next_states.keys()])
+        max_wins = sum([s.wins[1] for s in self.next_states.keys()])
         if debug:
-            print( "updating prob success from " + str( self.prob_success ) + " to " +
-                   str( (min_prob, max_prob) ) + " for guess: " + str( self ) )
-        self.prob_success = (min_prob, max_prob)
+            print( "updating wins from " + str( self.wins ) + " to " +
+                   str( (min_wins, max_wins) ) + " for guess: " + str( self ) )
+        self.wins = (min_wins, max_wins)
 
 
     def update_average_remaining_guesses(self):
@@ -833,18 +1080,18 @@ class Guess:
         s.prob_success = [(1 + 0.125*20)/21, 1.0] = [0.166666, 1.0]
         Combining these we have ([0,0] * [1/(1 + 20 * 0.125), 1/21] + [1.875, 4.0] * [(0.125 * 20)/(1 + 20 * 0.125), 20/21] ) = [1.875 * 2.5/3.5, 4 * 20/21] = [1.7857, 2.85]
 
+        Keeping total guesses instead of averages, the weighting is just adding up the totals of the next states since
+        each state's optimistic total is over its max wins, and its pessimistic total is over its min wins.  The
+        arithmetic is exact.
         """
         if not compute_num_guesses:
             return
-        total_prob_success = [0.0, 0.0]
-        total_prob_success[0] = sum([s.prob_success[0] * n for (s,n) in self.next_states.items()])
-        total_prob_success[1] = sum([s.prob_success[1] * n for (s,n) in self.next_states.items()])
-        optim_garg = sum([s.average_remaining_guesses[0] * s.prob_success[1] * n for (s, n) in self.next_states.items()]) / (total_prob_success[1])
-        pessim_garg = sum([s.average_remaining_guesses[1] * s.prob_success[0] * n for (s, n) in self.next_states.items()]) / (total_prob_success[0])
+        optim_total = sum([s.total_guesses[0] for s in self.next_states.keys()])
+        pessim_total = sum([s.total_guesses[1] for s in self.next_states.keys()])
         if debug:
-            print( "updating avg num guesses from " + str( self.average_remaining_guesses ) + " to " +
-                   str( (optim_garg, pessim_garg) ) + " for guess: " + str( self ) )
-        self.average_remaining_guesses = (optim_garg, pessim_garg)
+            print( "updating total guesses from " + str( self.total_guesses ) + " to " +
+                   str( (optim_total, pessim_total) ) + " for guess: " + str( self ) )
+        self.total_guesses = (optim_total, pessim_total)
 
     def __lt__( self, other ):
         """ Less than function used for prioritizing state expansion """
@@ -858,20 +1105,20 @@ class Guess:
             return True
         if sc and not oc:
             return False
+        sbad = is_inferior_guess(self)
+        obad = is_inferior_guess(other)
+        if sbad and not obad:
+            return False
+        if obad and not sbad:
+            return True
         if optimize_for_winning:
-            sbad = self.prev_state.num_prior_guesses > 0 and self.prob_success[1] < self.prev_state.prob_success[0] - 1e-12
-            obad = other.prev_state.num_prior_guesses > 0 and other.prob_success[1] < other.prev_state.prob_success[0] - 1e-12
-            if sbad and not obad:
-                return False
-            if obad and not sbad:
-                return True
-            c = cmp( self.prob_success, other.prob_success )
+            c = cmp( self.wins, other.wins )  # same denominator since they're guesses from the same State
             if c > 0:
                 return True
             elif c < 0:
                 return False
         if minimize_guesses:
-            c = cmp( self.average_remaining_guesses, other.average_remaining_guesses )
+            c = cmp_avg( self, other )
             if c < 0:
                 return True
             elif c > 0:
@@ -926,13 +1173,30 @@ class Guess:
 state_cache = [{} for i in range(6)]
 hits = 0
 misses = 0
+cross_depth_seeds = 0  # the number of new States whose bounds were tightened by States at other depths
 
 cache_on = True
+collect_garbage = True  # whether to occasionally evict States that are no longer reachable from init_state
+gc_interval = 100000  # number of search iterations between garbage collections of state_cache
+evicted_states = 0  # the total number of States evicted from state_cache by collect_unreachable_states()
+lazy_loaded = False  # whether some States were loaded without their guesses; see materialize_all()
 
 def reset_state_cache():
     global state_cache
+    global lazy_loaded
     # clear out the state cache
     state_cache = [{} for i in range(6)]
+    clear_dirty()
+    lazy_loaded = False
+
+def cache_depth(num_guesses: int):
+    """
+    The index of state_cache for States after the number of guesses.  When not optimizing for winning, there's no
+    limit on the number of guesses, so the best policy for the remaining candidates doesn't depend on how many
+    guesses were made, and all States after the first guess share the same dictionary.  The initial State can't be
+    reached again since every guess eliminates itself.
+    """
+    return num_guesses if optimize_for_winning else min(num_guesses, 1)
 
 def get_state( num_guesses: int, remaining_candidates: int ) -> object:
     """
@@ -942,6 +1206,7 @@ def get_state( num_guesses: int, remaining_candidates: int ) -> object:
     """
     if not cache_on: return None
     global hits
+    num_guesses = cache_depth(num_guesses)
     if len(state_cache) <= num_guesses:
         for i in range(len(state_cache), num_guesses+1):
             state_cache.append({})
@@ -961,7 +1226,7 @@ def get_or_cache_state(s: State):
     global state_cache
     global hits
     global misses
-    inner = state_cache[s.num_prior_guesses]
+    inner = state_cache[cache_depth(s.num_prior_guesses)]
     if s.remaining_candidates in inner.keys():
         cs = inner[s.remaining_candidates]
         if cs is not None:
@@ -969,14 +1234,106 @@ def get_or_cache_state(s: State):
             return cs
         misses += 1
         inner[s.remaining_candidates] = s
+        mark_dirty(s)
         return s
     misses += 1
     inner[s.remaining_candidates] = s
+    mark_dirty(s)
     return s
 
+def seed_from_other_depths(s: State):
+    """
+    Tighten the initial wins of a new State with the bounds of cached States that have the same remaining
+    candidates after a different number of guesses.  With fewer guesses left, the chance of winning can be no
+    better, so the min of a deeper State is a lower bound, and the max of a shallower State is an upper bound.
+    The bounds are remembered so that update_state_prob_success() doesn't loosen them as guesses are added.
+    The States have the same number of candidates, so their wins compare directly.
+    Average numbers of guesses are not seeded since they aren't ordered by depth in the same way.
+    """
+    global cross_depth_seeds
+    if not cache_on or not optimize_for_winning or s.remaining_candidates == 0:
+        return
+    min_wins, max_wins = s.wins
+    seeded = False
+    for d in range(len(state_cache)):
+        if d == s.num_prior_guesses:
+            continue
+        other = state_cache[d].get(s.remaining_candidates)
+        if other is None:
+            continue
+        if d > s.num_prior_guesses and other.wins[0] > min_wins:
+            min_wins = other.wins[0]
+            seeded = True
+        elif d < s.num_prior_guesses and other.wins[1] < max_wins:
+            max_wins = other.wins[1]
+            seeded = True
+    if seeded:
+        cross_depth_seeds += 1
+        s.wins_bounds = (min_wins, max_wins)
+        s.wins = (min_wins, max_wins)
+
 def cache_size():
     """ Return the number of States in the cache, represnting the size of the policy tree """
-    return sum([len(state_cache[i]) for i in range(6)])
+    return sum([len(inner) for inner in state_cache])
+
+def is_inferior_guess(g: Guess):
+    """
+    Whether the Guess can never be the policy choice of its previous State because its max probability of success is
+    less than the min of the State, or, when only minimizing guesses, because its optimistic average number of
+    guesses is worse than the pessimistic average of the State (the best pessimistic average of its guesses).  Since
+    bounds only get tighter, it will stay inferior.  Guesses from the initial state are never inferior because we
+    want the policies of all first guesses.
+    """
+    s = g.prev_state
+    if s.num_prior_guesses == 0:
+        return False
+    if optimize_for_winning:
+        return g.wins[1] < s.wins[0]
+    # Every candidate is won, so the guess and State totals are over the same number of wins.
+    return minimize_guesses and g.total_guesses[0] + g.wins[1] > s.total_guesses[1]
+
+def collapse_guess(g: Guess):
+    """
+    Drop the next states of an inferior Guess while keeping its word and bounds.  The next states are no longer
+    needed to compute the policy, and if no other guess leads to them, they are evicted from the cache by
+    collect_unreachable_states().
+    """
+    for cs in g.next_states.keys():
+        cs.incoming_guesses = [ig for ig in cs.incoming_guesses if ig is not g]
+    g.next_states = {}
+    mark_dirty(g.prev_state)
+
+def collect_unreachable_states():
+    """
+    Mark-and-sweep garbage collection of state_cache.  States are marked by walking the alternative guesses from
+    init_state, collapsing inferior guesses along the way.  Unmarked States are then removed from the cache, and
+    the guesses of evicted States are removed from the incoming_guesses of the States that are kept.
+    :return: the number of States evicted
+    """
+    global evicted_states
+    reachable = set()  # ids of reachable States
+    stack = [init_state]
+    while stack:
+        s = stack.pop()
+        if id(s) in reachable:
+            continue
+        reachable.add(id(s))
+        for g in s.alternative_next_guesses:
+            if g.next_states and is_inferior_guess(g):
+                collapse_guess(g)
+            stack.extend(g.next_states.keys())
+    evicted = 0
+    for inner in state_cache:
+        for rc in [rc for (rc, s) in inner.items() if id(s) not in reachable]:
+            del inner[rc]
+            evicted += 1
+    if evicted > 0:
+        for inner in state_cache:
+            for s in inner.values():
+                if len(s.incoming_guesses) > 0:
+                    s.incoming_guesses = [g for g in s.incoming_guesses if id(g.prev_state) in reachable]
+    evicted_states += evicted
+    return evicted
 
 def cache_state_from(arr):
     """
@@ -992,33 +1349,583 @@ def cache_state_from(arr):
         s = get_or_cache_state(s)
     deserialize_state(s, arr)
 
-def write_cache_to_file(filename, as_binary=True, zip=True):
+checkpoint_magic = b'WRDLCKP2'  # the start of each record of a checkpoint written by write_checkpoint_record()
+checkpoint_block_size = 1 << 20  # bytes of the checkpoint stream compressed or decompressed at a time
+checkpoint_interval = 50000  # the number of search iterations between checkpoints
+checkpoint_compaction_ratio = 1.0  # the log is folded into a new base snapshot when it gets bigger than this times the base
+checkpoint_generation = 0  # the generation of the base snapshot; log records for other generations are ignored
+dirty_states = []  # the States changed since the last checkpoint, marked by mark_dirty()
+checkpoint_in_background = True  # whether checkpoint() writes the snapshot with a thread while the search continues
+checkpoints_written = 0
+checkpoint_pause_time = 0.0  # the total wall-clock seconds that the search paused to take snapshots for checkpoints
+checkpoint_write_time = 0.0  # the total wall-clock seconds from taking the snapshots to finishing writing them
+_checkpoint_thread = None  # the thread writing a checkpoint in the background
+_checkpoint_error = None  # the exception of the thread if writing failed
+resume_runs = True  # whether run() resumes from the newest valid checkpoint of the word lists
+prior_cpu_time = 0.0  # CPU seconds of the search before it was resumed from a checkpoint
+# the progress counters saved in the checkpoint manifest so that they continue across restarts
+checkpoint_counters = ['_ct', '_ctp', '_ctg', 'hits', 'misses', 'evicted_states', 'cross_depth_seeds',
+                       'closed_form_states', 'endgame_hits', 'endgame_misses', 'partition_hits', 'partition_misses',
+                       'checkpoints_written', 'checkpoint_pause_time', 'checkpoint_write_time']
+# The tables of a checkpoint record after its header, in order: (name, array typecode, table whose length it has).
+# A State has its guesses and a Guess has its children next to each other, so the numbers of them delimit the rows.
+checkpoint_columns = [('state_set', 'I', 'states'), ('state_depth', 'I', 'states'),
+                      ('state_num_guesses', 'I', 'states'), ('state_wins', 'q', 'states2'),
+                      ('state_total', 'q', 'states2'), ('guess_word', 'I', 'guesses'),
+                      ('guess_num_children', 'I', 'guesses'), ('guess_wins', 'q', 'guesses2'),
+                      ('guess_total', 'q', 'guesses2'), ('edge_state', 'I', 'edges'), ('edge_count', 'I', 'edges')]
+checkpoint_header = ['mode', 'width', 'num_sets', 'num_states', 'num_guesses', 'num_edges', 'init_index',
+                     'num_written', 'generation']  # the int64 fields after the word_list_key() of a record
+
+def mark_dirty(s: State):
+    """ Remember that the State or one of its guesses changed since the last checkpoint """
+    if not s.dirty:
+        s.dirty = True
+        dirty_states.append(s)
+
+def clear_dirty():
+    """ Forget the changes after they are written to a checkpoint or the States are loaded from one """
+    for s in dirty_states:
+        s.dirty = False
+    dirty_states.clear()
+
+def checkpoint_filename():
+    return cache_path("checkpoint_policy" + ("" if hard_mode else "_easy") + ".bin", *guess_word_lists())
+
+def checkpoint_log_filename(filename: str):
+    """ The log of the States changed since the base snapshot in the file, written by append_checkpoint_delta() """
+    return filename + '.log'
+
+def checkpoint_mode() -> int:
+    """ The search settings that the States of a checkpoint depend on, as bit flags """
+    return (optimize_for_winning << 0) | (minimize_guesses << 1) | (hard_mode << 2) | (compute_num_guesses << 3)
+
+def checkpoint_tables(states: list = None):
+    """
+    Flatten States into the columns of a checkpoint.  Each distinct bloom filter is stored once in a table of sets,
+    and the States, Guesses and edges (child State index, count) are rows of integer columns.  By default, all
+    cached States are written, along with the uncached ones (when the cache is off) as they are found.  For a list
+    of States, such as dirty_states, only those are written in full, and the children of their guesses that aren't
+    in the list are added after them as references without guesses.
+    The tables are a snapshot that doesn't change as the search continues, so they can be written by another thread.
+    :return: (word_list_key(), header array of checkpoint_header, sets, {column name: array})
+    """
+    materialize_all()
+    written_all = states is None
+    if written_all:
+        states = [s for inner in state_cache for s in inner.values()]
+        if state_cache[0].get(init_state.remaining_candidates) is not init_state:
+            states.insert(0, init_state)
+    else:
+        states = list(states)
+    num_written = len(states)
+    state_indices = {id(s): i for (i, s) in enumerate(states)}
+    set_indices = {}  # bloom filter -> index in sets
+    cols = {name: array(typecode) for (name, typecode, _) in checkpoint_columns}
+    i = 0
+    while i < len(states):
+        s = states[i]
+        guesses = s.alternative_next_guesses if written_all or i < num_written else []
+        i += 1
+        cols['state_set'].append(set_indices.setdefault(s.remaining_candidates, len(set_indices)))
+        cols['state_depth'].append(s.num_prior_guesses)
+        cols['state_num_guesses'].append(len(guesses))
+        cols['state_wins'].extend(s.wins)
+        cols['state_total'].extend(s.total_guesses)
+        for g in guesses:
+            cols['guess_word'].append(g.word)
+            cols['guess_num_children'].append(len(g.next_states))
+            cols['guess_wins'].extend(g.wins)
+            cols['guess_total'].extend(g.total_guesses)
+            for (cs, n) in g.next_states.items():
+                ci = state_indices.get(id(cs))
+                if ci is None:
+                    ci = state_indices[id(cs)] = len(states)
+                    states.append(cs)
+                cols['edge_state'].append(ci)
+                cols['edge_count'].append(n)
+    if written_all:
+        num_written = len(states)
+    header = array('q', [checkpoint_mode(), (len(guess_candidates) + 7) // 8, len(set_indices), len(states),
+                         len(cols['guess_word']), len(cols['edge_state']), state_indices.get(id(init_state), -1),
+                         num_written, checkpoint_generation])
+    return word_list_key(*guess_word_lists()), header, list(set_indices.keys()), cols
+
+def write_checkpoint_record(f, tables: tuple, digest=None):
+    """
+    Write States to the open file in one pass as a record of a checkpoint: checkpoint_magic followed by a zlib
+    stream compressed in blocks of the word_list_key(), the fields of checkpoint_header, the distinct bloom filters
+    as fixed-width little-endian integers, and then the columns of checkpoint_columns.  Every bloom filter is
+    written once however many Guesses lead to its State, and the columns are read back in bulk by
+    read_checkpoint_record().
+    :param tables: from checkpoint_tables()
+    :param digest: a hashlib object to update with the bytes written
+    :return: the number of bytes written
+    """
+    (key, header, sets, cols) = tables
+    width = header[checkpoint_header.index('width')]
+    z = zlib.compressobj()
+    size = 0
+
+    def write_block(block):
+        nonlocal size
+        f.write(block)
+        if digest is not None:
+            digest.update(block)
+        size += len(block)
+
+    def write(data):
+        for i in range(0, len(data), checkpoint_block_size):
+            write_block(z.compress(data[i:i + checkpoint_block_size]))
+
+    write_block(checkpoint_magic)
+
+    write(key.encode() + little_endian(header))
+    buf = bytearray()
+    for rc in sets:
+        buf += rc.to_bytes(width, 'little')
+        if len(buf) >= checkpoint_block_size:
+            write(bytes(buf))
+            buf.clear()
+    write(bytes(buf))
+    for (name, _, _) in checkpoint_columns:
+        write(little_endian(cols[name]))
+    write_block(z.flush())
+    return size
+
+def little_endian(a: array) -> bytes:
+    """ The bytes of the array in little-endian order, as they are stored in a checkpoint """
+    if sys.byteorder != 'little':
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+def read_checkpoint_record(f):
+    """
+    Read a record written by write_checkpoint_record(), decompressing the file in blocks, and leave the file at the
+    start of the next record.
+    :return: ({checkpoint_header field: value, 'key': word_list_key()}, sets, {column name: array}), or None at the
+             end of the file
+    """
+    magic = f.read(len(checkpoint_magic))
+    if not magic:
+        return None
+    if magic != checkpoint_magic:
+        raise ValueError(f.name + ' is not a checkpoint')
+    z = zlib.decompressobj()
+    buf = bytearray()
+
+    def read(n):
+        while len(buf) < n:
+            block = f.read(checkpoint_block_size)
+            if not block:
+                raise EOFError(f.name + ' is truncated')
+            buf.extend(z.decompress(block))
+        data = bytes(buf[:n])
+        del buf[:n]
+        return data
+
+    def read_array(typecode: str, n: int):
+        a = array(typecode)
+        a.frombytes(read(n * a.itemsize))
+        if sys.byteorder != 'little':
+            a.byteswap()
+        return a
+
+    key = read(len(word_list_key()))
+    header = dict(zip(checkpoint_header, read_array('q', len(checkpoint_header))))
+    header['key'] = key.decode()
+    width = header['width']
+    data = read(header['num_sets'] * width)
+    sets = [int.from_bytes(data[i:i + width], 'little') for i in range(0, len(data), width)]
+    lengths = {'states': header['num_states'], 'states2': 2 * header['num_states'], 'guesses': header['num_guesses'],
+               'guesses2': 2 * header['num_guesses'], 'edges': header['num_edges']}
+    cols = {name: read_array(typecode, lengths[table]) for (name, typecode, table) in checkpoint_columns}
+    while not z.eof:
+        block = f.read(checkpoint_block_size)
+        if not block:
+            raise EOFError(f.name + ' is truncated')
+        z.decompress(block)
+    f.seek(-len(z.unused_data), os.SEEK_CUR)
+    return header, sets, cols
+
+def checkpoint_matches(header: dict) -> bool:
+    """ Whether a checkpoint record is for the current word lists and search settings """
+    return header['key'] == word_list_key(*guess_word_lists()) and header['mode'] == checkpoint_mode()
+
+def checkpoint_record_states(header: dict, sets: list, cols: dict):
+    """
+    The first pass of loading a checkpoint record: find or create the State of every row of its state table in
+    state_cache, and prepare the columns for wiring the guesses with materialize().
+    :return: the record as a dictionary of its States by row and its columns
+    """
+    states = []
+    depths = cols['state_depth']
+    set_indices = cols['state_set']
+    for i in range(len(state_cache), cache_depth(max(depths, default=0)) + 1):
+        state_cache.append({})
+    inners = [state_cache[cache_depth(d)] for d in range(max(depths, default=0) + 1)]
+    for row in range(header['num_states']):
+        rc = sets[set_indices[row]]
+        inner = inners[depths[row]]
+        s = inner.get(rc)
+        if s is None:
+            s = State()
+            s.num_prior_guesses = depths[row]
+            s.remaining_candidates = rc
+            inner[rc] = s
+        states.append(s)
+    # The rows of the guesses of a State and the children of a Guess start after those of the rows before them.
+    return {'states': states, 'num_written': header['num_written'],
+            'guess_start': list(accumulate(cols['state_num_guesses'], initial=0)),
+            'edge_start': list(accumulate(cols['guess_num_children'], initial=0)),
+            'state_wins': list(zip(cols['state_wins'][0::2], cols['state_wins'][1::2])),
+            'state_total': list(zip(cols['state_total'][0::2], cols['state_total'][1::2])),
+            'guess_wins': list(zip(cols['guess_wins'][0::2], cols['guess_wins'][1::2])),
+            'guess_total': list(zip(cols['guess_total'][0::2], cols['guess_total'][1::2])),
+            'guess_word': cols['guess_word'], 'edge_state': cols['edge_state'], 'edge_count': cols['edge_count']}
+
+def load_checkpoint_records(records: list, lazy: bool = False):
+    """
+    Load checkpoint records in bulk, in two passes.  The first creates all States with checkpoint_record_states(),
+    and the bounds of each State come from the last record that has it in full.  The second wires the guesses and
+    their children from the integer columns with materialize().
+    :param records: prepared by checkpoint_record_states(), the base snapshot first and then the log in order
+    :param lazy: whether to leave the guesses of the States to be built when play() or explore() gets to them
+    """
+    global lazy_loaded
+    sources = {}  # id(State) -> (State, record, row) of the last record that has the State in full
+    for record in records:
+        states = record['states']
+        for row in range(record['num_written']):
+            s = states[row]
+            sources[id(s)] = (s, record, row)
+    for (s, record, row) in sources.values():
+        s.wins = record['state_wins'][row]
+        s.total_guesses = record['state_total'][row]
+        s.lazy = (record, row)
+        if not lazy:
+            materialize(s)
+    lazy_loaded = lazy_loaded or lazy
+
+def materialize(s: State):
+    """
+    Build the guesses of a State that was loaded lazily from the columns of its checkpoint record, and add them to
+    the incoming guesses of their children.  The children are already loaded, with their bounds, but their own
+    guesses are built when they are materialized in turn.
+    """
+    if s is None or s.lazy is None:
+        return
+    (record, row) = s.lazy
+    s.lazy = None
+    for g in s.alternative_next_guesses:
+        collapse_guess(g)  # a State loaded again replaces its guesses
+    states = record['states']
+    guess_word = record['guess_word']
+    guess_wins = record['guess_wins']
+    guess_total = record['guess_total']
+    edge_start = record['edge_start']
+    edge_state = record['edge_state']
+    edge_count = record['edge_count']
+    guesses = []
+    for gi in range(record['guess_start'][row], record['guess_start'][row + 1]):
+        g = Guess()
+        g.word = guess_word[gi]
+        g.prev_state = s
+        g.wins = guess_wins[gi]
+        g.total_guesses = guess_total[gi]
+        for e in range(edge_start[gi], edge_start[gi + 1]):
+            cs = states[edge_state[e]]
+            g.next_states[cs] = edge_count[e]
+            cs.incoming_guesses.append(g)
+        guesses.append(g)
+    s.alternative_next_guesses = guesses
+
+def materialize_all():
+    """ Build the guesses of all States that were loaded lazily, which the search needs """
+    global lazy_loaded
+    if lazy_loaded:
+        for inner in state_cache:
+            for s in inner.values():
+                materialize(s)
+        lazy_loaded = False
+
+def snapshot_checkpoint(compact: bool):
+    """
+    Take the tables of the next checkpoint and forget the dirty States.
+    :param compact: whether to snapshot all States for a new base of the next generation, else the dirty States
+    :return: the tables from checkpoint_tables()
+    """
+    global checkpoint_generation
+    if compact:
+        checkpoint_generation += 1
+    tables = checkpoint_tables(None if compact else dirty_states)
+    clear_dirty()
+    return tables
+
+def write_checkpoint_files(filename: str, tables: tuple, compact: bool, digest=None):
+    """
+    Write a snapshot from snapshot_checkpoint().  A new base is written to a temporary file that replaces the old
+    base when it is complete and synced to disk, so a crash never leaves a partly written base, and then the log is
+    emptied.  A delta is appended to the log.  A crash while appending leaves a truncated last record, which fails
+    the zlib checks and is dropped by read_checkpoint().
+    :param digest: a hashlib object to update with the bytes written
+    :return: the number of bytes written
+    """
+    if not compact:
+        with open(checkpoint_log_filename(filename), 'ab') as f:
+            size = write_checkpoint_record(f, tables, digest)
+            f.flush()
+            os.fsync(f.fileno())
+        return size
+    with open(filename + '.tmp', 'wb') as f:
+        size = write_checkpoint_record(f, tables, digest)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(filename + '.tmp', filename)
+    with open(checkpoint_log_filename(filename), 'wb'):
+        pass
+    return size
+
+def write_checkpoint(filename: str):
+    """
+    Write all States to a new base snapshot of the next generation and start a new, empty log.
+    :return: the number of bytes written
+    """
+    wait_for_checkpoint()
+    return write_checkpoint_files(filename, snapshot_checkpoint(True), True)
+
+def append_checkpoint_delta(filename: str):
+    """
+    Append a record of the States changed since the last checkpoint to the log of the base snapshot, so the cost
+    of a checkpoint is proportional to the recent work rather than to the size of the cache.
+    :return: the number of bytes written
+    """
+    wait_for_checkpoint()
+    return write_checkpoint_files(filename, snapshot_checkpoint(False), False)
+
+def generation_filename(filename: str, generation: int):
+    """ The base snapshot of a generation of the checkpoints named by the file, e.g. checkpoint_policy.3.bin """
+    (root, ext) = os.path.splitext(filename)
+    return root + '.' + str(generation) + ext
+
+def manifest_filename(filename: str):
+    return filename + '.manifest.json'
+
+def checkpoint(filename: str = None):
+    """
+    Save the changes to the policy since the last checkpoint.  They are appended to the log until the log gets
+    bigger than checkpoint_compaction_ratio times the base snapshot, which is then rewritten with all States as the
+    next generation.  The search only pauses to take the snapshot.  With checkpoint_in_background, the snapshot is
+    written by a thread while the search continues (zlib and file writes release the GIL), and the next checkpoint
+    waits for it.  After each write, the manifest is replaced to list the newest two generations with the sizes and
+    checksums of their bases and the progress counters as of their last records, for resume_from_checkpoint().
+    :param filename: names the checkpoints, checkpoint_filename() by default; see generation_filename()
+    """
+    global _checkpoint_thread
+    global checkpoint_pause_time
+    filename = filename or checkpoint_filename()
+    wait_for_checkpoint()
+    base = generation_filename(filename, checkpoint_generation)
+    log = checkpoint_log_filename(base)
+    compact = (checkpoint_generation == 0 or not os.path.exists(base) or not os.path.exists(log) or
+               os.path.getsize(log) > checkpoint_compaction_ratio * os.path.getsize(base))
+    start = time.perf_counter()
+    tables = snapshot_checkpoint(compact)
+    progress = {name: globals()[name] for name in checkpoint_counters}
+    progress['cpu_time'] = process_time() - tl_start
+    pause = time.perf_counter() - start
+    checkpoint_pause_time += pause
+    args = (filename, tables, compact, progress, start, pause)
+    if checkpoint_in_background:
+        _checkpoint_thread = threading.Thread(target=_write_checkpoint_in_background, args=args, daemon=True)
+        _checkpoint_thread.start()
+    else:
+        _write_checkpoint_in_background(*args)
+
+def _write_checkpoint_in_background(filename: str, tables: tuple, compact: bool, progress: dict, start: float,
+                                    pause: float):
+    """ Write a snapshot with write_checkpoint_files(), update the manifest, and report the times """
+    global checkpoints_written
+    global checkpoint_write_time
+    global _checkpoint_error
+    generation = tables[1][checkpoint_header.index('generation')]
+    base = generation_filename(filename, generation)
+    try:
+        digest = hashlib.sha256()
+        size = write_checkpoint_files(base, tables, compact, digest)
+        manifest = read_manifest(filename) or {'checkpoints': []}
+        if compact:
+            entry = {'generation': generation, 'base': os.path.basename(base), 'size': size,
+                     'sha256': digest.hexdigest(), 'progress': progress}
+            kept = [entry] + [e for e in manifest['checkpoints'] if e['generation'] == generation - 1]
+        else:
+            kept = [dict(e, progress=progress) if e['generation'] == generation else e
+                    for e in manifest['checkpoints']]
+        write_manifest(filename, {'key': tables[0], 'mode': tables[1][checkpoint_header.index('mode')],
+                                  'checkpoints': kept})
+        if compact:
+            for e in manifest['checkpoints']:
+                if e['generation'] not in (generation, generation - 1):
+                    remove_checkpoint_files(generation_filename(filename, e['generation']))
+    except Exception as e:
+        _checkpoint_error = e
+        return
+    elapsed = time.perf_counter() - start
+    checkpoints_written += 1
+    checkpoint_write_time += elapsed
+    print("\n" + ("wrote base snapshot " + base if compact else "appended " +
+                  str(tables[1][checkpoint_header.index('num_written')]) + " changed states to " +
+                  checkpoint_log_filename(base)) + " (" + str(size) + " bytes) in " + str(elapsed) +
+          " seconds, pausing the search for " + str(pause) + " seconds\n")
+
+def wait_for_checkpoint():
+    """ Wait for the checkpoint being written in the background, raising the exception if it failed """
+    global _checkpoint_thread
+    global _checkpoint_error
+    if _checkpoint_thread is not None:
+        _checkpoint_thread.join()
+        _checkpoint_thread = None
+    if _checkpoint_error is not None:
+        e = _checkpoint_error
+        _checkpoint_error = None
+        raise e
+
+def remove_checkpoint_files(base: str):
+    for fn in (base, checkpoint_log_filename(base)):
+        if os.path.exists(fn):
+            os.remove(fn)
+
+def write_manifest(filename: str, manifest: dict):
+    """ Replace the manifest of the checkpoints atomically, with a checksum of its contents """
+    manifest = dict(manifest, checksum=hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest())
+    fn = manifest_filename(filename)
+    with open(fn + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(fn + '.tmp', fn)
+
+def read_manifest(filename: str):
+    """
+    :return: the manifest written by write_manifest() without its checksum, or None if there is none, or it is
+             corrupt or for other word lists or search settings
+    """
+    fn = manifest_filename(filename)
+    try:
+        with open(fn) as f:
+            manifest = json.load(f)
+        checksum = manifest.pop('checksum', None)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(fn + ' could not be read')
+        print(str(e))
+        return None
+    if checksum != hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest():
+        print(fn + ' is corrupt')
+        return None
+    if manifest['key'] != word_list_key(*guess_word_lists()) or manifest['mode'] != checkpoint_mode():
+        return None
+    return manifest
+
+def file_sha256(filename: str):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(checkpoint_block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def resume_from_checkpoint(filename: str = None, lazy: bool = False) -> bool:
+    """
+    Replace the policy with the newest checkpoint in the manifest whose base snapshot matches its size and
+    checksum, falling back to the previous generation, and continue the progress counters and CPU time from it.
+    A truncated or corrupt end of the log is cut off so that new records are appended after the valid ones.
+    :param filename: names the checkpoints, checkpoint_filename() by default
+    :param lazy: whether to build the guesses of a State only when play() or explore() gets to it, for just playing
+                 the policy
+    :return: whether a checkpoint was loaded
+    """
+    global prior_cpu_time
+    filename = filename or checkpoint_filename()
+    wait_for_checkpoint()
+    manifest = read_manifest(filename)
+    if manifest is None:
+        return False
+    for entry in manifest['checkpoints']:
+        base = os.path.join(os.path.dirname(filename), entry['base'])
+        if not os.path.exists(base) or os.path.getsize(base) != entry['size'] or file_sha256(base) != entry['sha256']:
+            print(base + ' is missing or does not match the manifest')
+            continue
+        tl = process_time()
+        if not replace_policy_from_file(base, repair=True, lazy=lazy):
+            continue
+        for name in checkpoint_counters:
+            globals()[name] = entry['progress'][name]
+        prior_cpu_time = entry['progress']['cpu_time']
+        print("resumed from " + base + " with " + str(cache_size()) + " states after " + str(prior_cpu_time) +
+              " CPU seconds of search; seconds elapsed to load = " + str(process_time() - tl))
+        return True
+    return False
+
+def read_checkpoint(filename: str, repair: bool = False, lazy: bool = False) -> bool:
+    """
+    Load the base snapshot in the file and then the records of its log in order, skipping records of other
+    generations and a truncated or corrupt last record, with load_checkpoint_records().
+    :param repair: whether to cut a truncated or corrupt end off the log
+    :param lazy: whether to build the guesses of a State only when play() or explore() gets to it
+    :return: False if the checkpoint is for other word lists or search settings, else True
+    """
+    global checkpoint_generation
+    wait_for_checkpoint()
+    with open(filename, 'rb') as f:
+        (header, sets, cols) = read_checkpoint_record(f)
+    if not checkpoint_matches(header):
+        print(filename + ' is for other word lists or search settings')
+        return False
+    records = [checkpoint_record_states(header, sets, cols)]
+    checkpoint_generation = header['generation']
+    log = checkpoint_log_filename(filename)
+    if os.path.exists(log):
+        with open(log, 'rb+' if repair else 'rb') as f:
+            while True:
+                end = f.tell()
+                try:
+                    record = read_checkpoint_record(f)
+                except (EOFError, ValueError, zlib.error) as e:
+                    print(log + ': ' + str(e) + '; ignoring the rest of the log')
+                    if repair:
+                        f.truncate(end)
+                    break
+                if record is None:
+                    break
+                (header, sets, cols) = record
+                if checkpoint_matches(header) and header['generation'] == checkpoint_generation:
+                    records.append(checkpoint_record_states(header, sets, cols))
+    load_checkpoint_records(records, lazy)
+    clear_dirty()
+    return True
+
+def write_cache_to_file(filename, as_binary=True):
     """
     Write the state cache (including the policy search tree) to file so that it may be loaded in another run
     to avoid computation.
     :param filename:
-    :param as_binary:
+    :param as_binary: whether to write a compressed checkpoint with write_checkpoint(), else a line of text per State
     :return:
     """
-    with open(filename, 'wb' if as_binary else 'w') as f:
+    if as_binary:
+        size = write_checkpoint(filename)
+        print('\nwrote cache to ' + filename + " (" + str(size) + " bytes)\n")
+        return
+    with open(filename, 'w') as f:
         for i in range(len(state_cache)):
             for _, s in state_cache[i].items():
-                arr = serialize_state(s)
-                if as_binary:
-                    pickle.dump(arr, f)
-                else:
-                    f.write(str(arr) + "\n")
-    if zip:
-        with ZipFile(filename + '.zip', 'w', zipfile.ZIP_DEFLATED) as myzip:
-            myzip.write(filename)
-        os.remove(filename)
-        filename = filename + '.zip'
-
-
+                f.write(str(serialize_state(s)) + "\n")
     print('\nwrote cache to ' + filename + "\n")
 
 
-def read_cache_from_file(filename, as_binary=True):
+def read_cache_from_file(filename, as_binary=True, repair=False, lazy=False):
     """
     Load the state cache (with the policy search tree) from file to avoid recomputation. It can merge with the
     existing state_cache, but it will overwrite probabilities potentially have inconsistent value.<br>
@@ -1027,26 +1934,52 @@ def read_cache_from_file(filename, as_binary=True):
     IMPORTANT -- Be sure that init_state is replaced with the state in state_cache[0].
 
     :param filename:
-    :param as_binary:
-    :return:
+    :param as_binary: whether the file is a checkpoint from write_checkpoint() (or a stream of pickled States from
+                      older versions), else a line of text per State; the log of a checkpoint is read too
+    :param repair: whether to cut a truncated or corrupt end off the log of a checkpoint
+    :param lazy: whether to build the guesses of the States of a checkpoint only when play() or explore() gets to
+                 them; see materialize()
+    :return: False if a checkpoint is for other word lists or search settings, else True
     """
     with open(filename, 'rb' if as_binary else 'r') as f:
+        if as_binary and f.read(len(checkpoint_magic)) == checkpoint_magic:
+            f.close()
+            return read_checkpoint(filename, repair, lazy)
+        f.seek(0)
         try:
             while True:
                 if as_binary:
                     arr = pickle.load(f)
                 else:
                     line = f.readline()
+                    if not line:
+                        break
                     arr = json.loads(line)
                 cache_state_from(arr)
         except EOFError:
             pass
+    return True
 
-def replace_policy_from_file(filename, as_binary=True):
+def replace_policy_from_file(filename, as_binary=True, repair=False, lazy=False):
+    """
+    Replace the state cache with the one in the file.  If the file can't be read, the old cache is put back.
+    :return: whether the cache was replaced
+    """
     global init_state
-    reset_state_cache()  # dangerous to do first, but don't want two caches using RAM at the same time
-    read_cache_from_file(filename, as_binary)
+    global state_cache
+    old_cache = state_cache
+    reset_state_cache()
+    try:
+        loaded = read_cache_from_file(filename, as_binary, repair, lazy)
+    except Exception as e:
+        print(filename + ' could not be read')
+        print(str(e))
+        loaded = False
+    if not loaded:
+        state_cache = old_cache
+        return False
     init_state = get_or_cache_state(init_state)
+    return True
 
 # lower number is higher priority
 def q_priority(s: State):
@@ -1057,13 +1990,74 @@ def q_priority(s: State):
     return (1.0 - s.prob_success[0], 1.0 - s.prob_success[1],
             s.num_prior_guesses, len(s.alternative_next_guesses), s.get_num_remaining_candidates())
 
+def update_word_list(new_solutions: list):
+    """
+    Refresh the policy after the solution list changes, say when a few words are dropped or added, without starting
+    over.  The solutions are reordered to keep the old ones in their old order followed by the new ones, so the
+    matrix is patched by patch_matrix_columns(), and the bloom filter of an old State without dropped solutions
+    only needs their bits removed.  Such a State is the same subproblem as before, so its bounds and expanded
+    guesses stay valid, and it is kept in the cache.  The search then restarts from a new initial State.  Wherever
+    it reaches candidates that the change didn't affect, it finds the old State instead of solving it again, so only
+    the subtrees with changed candidates are solved.  Old States that are no longer reachable are evicted by
+    occasionally_collect_garbage().  States are only kept in hard mode without herrings, where the guesses from a
+    State only depend on its candidates.
+    :param new_solutions: the new list of solutions
+    """
+    global wordle_solutions
+    global wordle_herrings
+    global init_state
+    global prior_cpu_time
+    global checkpoint_generation
+    old_solutions = wordle_solutions
+    keep_states = hard_mode and not use_herrings
+    old_states = [s for inner in state_cache for s in inner.values()] if keep_states else []
+    old_endgame = list(endgame_table.items()) if keep_states else []
+    new_set = set(new_solutions)
+    old_set = set(old_solutions)
+    wordle_solutions = [w for w in old_solutions if w in new_set] + [w for w in new_solutions if w not in old_set]
+    wordle_herrings = [w for w in wordle_herrings if w not in new_set]
+    print("updating the solutions: " + str(len(old_set - new_set)) + " dropped, " + str(len(new_set - old_set)) +
+          " added")
+    clear_tables()
+    init_globals((old_solutions, remaining_candidates))
+    prior_cpu_time = 0.0
+    checkpoint_generation = 0
+
+    dropped = dropped_indices(old_solutions)
+    dropped_mask = sum(1 << i for i in dropped)
+    kept = {id(s): s for s in old_states if not s.remaining_candidates & dropped_mask}
+    for s in kept.values():
+        s.remaining_candidates = drop_candidates(s.remaining_candidates, dropped)
+        s.guess_options = None
+        s.incoming_guesses = [g for g in s.incoming_guesses if id(g.prev_state) in kept]
+        for g in s.alternative_next_guesses:
+            g.word = word_indices[old_solutions[g.word]]
+        state_cache[cache_depth(s.num_prior_guesses)][s.remaining_candidates] = s
+    for s in kept.values():
+        for g in s.alternative_next_guesses:
+            g.next_states = dict(g.next_states.items())  # the hashes of the States changed
+    for ((num_guesses_left, cands), (wins, total_guesses, word)) in old_endgame:
+        if not cands & dropped_mask:
+            endgame_table[(num_guesses_left, drop_candidates(cands, dropped))] = (wins, total_guesses,
+                                                                                 word_indices[old_solutions[word]])
+    print("kept " + str(len(kept)) + " of " + str(len(old_states)) + " cached states and " + str(len(endgame_table)) +
+          " endgame table entries")
+
+    init_state = State()
+    init_state.remaining_candidates = all_guess_candidates if hard_mode else all_solution_candidates
+    init_state.wins = (0, len(wordle_solutions))
+    init_state = get_or_cache_state(init_state)
+    read_endgame_table(endgame_table_filename())
+    run_no_init()
+
 def runq():
     """ The main search loop for using a queue of search states (superseded by run()). """
     global init_state
     init_globals()
     q = queue.PriorityQueue()  # TreeSet(State)  # order by number of prior guesses and prob_success
     init_state = State()
-    init_state.remaining_candidates = all_solution_candidates
+    init_state.remaining_candidates = all_guess_candidates if hard_mode else all_solution_candidates
+    init_state.wins = (0, len(wordle_solutions))
 
     q.put((q_priority(init_state), init_state))
     while not q.empty():
@@ -1073,10 +2067,10 @@ def runq():
             print("popped " + str(s))
         child_states = expand(s)
         for c in child_states:
-            if c.prob_success[0] < c.prob_success[1]:
+            if c.wins[0] < c.wins[1]:
                 q.put((q_priority(c), c))
-        if len(s.alternative_next_guesses) < s.get_num_remaining_candidates():
-            if (s.prob_success[0] < s.prob_success[1] and
+        if len(s.alternative_next_guesses) < s.get_num_guess_options():
+            if (s.wins[0] < s.wins[1] and
                     (len(s.incoming_guesses) == 0 or
                      s.prob_success[1] >= max([max([g.prob_success[0] for g in i.prev_state.alternative_next_guesses]) for i in s.incoming_guesses]))):
                 q.put((q_priority(s), s))
@@ -1085,12 +2079,12 @@ def runq():
 
     print("init_state probability = " + str(init_state.prob_success))
     for g in init_state.alternative_next_guesses:
-        print("prob of choosing " + wordle_solutions[g.word] + " = " + str(g.prob_success))
+        print("prob of choosing " + guess_candidates[g.word] + " = " + str(g.prob_success))
 
 def all_guesses_done(s: State):
     """ Returns whether all of the alternative guesses for the State have been sufficiently explored to converge on
         a probability of success or on an expected number of guesses left. """
-    if len(s.alternative_next_guesses) < s.get_num_remaining_candidates():
+    if len(s.alternative_next_guesses) < s.get_num_guess_options():
         return False
     for g in s.alternative_next_guesses:
         if not converged(g):
@@ -1102,7 +2096,7 @@ def converged(sg):
     Whether the State or Guess has been sufficiently explored such that it has converged on a probability of winning
     or an expected number of remaining guesses.
     """
-    if sg.prob_success[1] - sg.prob_success[0] > 1E-12:
+    if sg.wins[0] != sg.wins[1]:
         return False
     if not compute_num_guesses or not converged_anrg(sg):
         return False
@@ -1115,7 +2109,7 @@ def converged_anrg(sg):
     # TODO -- Need to add a converged flag to State and Guess
     # It possible that the optimistic and pessimistic averages could be the same
     # even though neither has converged.
-    if abs(sg.average_remaining_guesses[1] - sg.average_remaining_guesses[0]) > 1E-12:
+    if sg.total_guesses[0] * sg.wins[0] != sg.total_guesses[1] * sg.wins[1]:
         return False
     return True
 
@@ -1123,17 +2117,28 @@ def print_progress():
     """ Print some stats and progress on finding the best words """
     print("")
     print("cached states = " + str(cache_size()) + ", hits = " + str(hits) + ", misses = " + str(misses) +
-          ", hit/miss = " + (str(((0.0 + hits) / misses)) if misses != 0 else "N/A") + ", " +
+          ", hit/miss = " + (str(((0.0 + hits) / misses)) if misses != 0 else "N/A") +
+          ", evicted = " + str(evicted_states) + ", cross-depth seeds = " + str(cross_depth_seeds) +
+          ", closed form = " + str(closed_form_states) + ", endgame table = " + str(len(endgame_table)) +
+          " (hits = " + str(endgame_hits) + ", misses = " + str(endgame_misses) + "), " +
           str((process_time() - tl_start) / 60) + " CPU minutes")
+    num_partitions = partition_hits + partition_misses
+    print("partitions: cached = " + str(len(partition_cache)) + ", hits = " + str(partition_hits) +
+          ", misses = " + str(partition_misses) + ", hit rate = " +
+          (str((0.0 + partition_hits) / num_partitions) if num_partitions != 0 else "N/A"))
+    if checkpoints_written > 0:
+        print("checkpoints: written = " + str(checkpoints_written) + ", search paused for snapshots = " +
+              str(checkpoint_pause_time) + " seconds, writing = " + str(checkpoint_write_time) + " seconds")
     if optimize_for_winning:
-        always_win = [wordle_solutions[g.word] for g in init_state.alternative_next_guesses if cmp(g.prob_success, (1.0, 1.0)) == 0]
+        n = init_state.num_outcomes()
+        always_win = [guess_candidates[g.word] for g in init_state.alternative_next_guesses if g.wins == (n, n)]
         print(str(len(always_win)) + " first guesses found so far with policies guaranteeing 100% wins: " + str(always_win))
-    converged_guesses = {wordle_solutions[g.word]: (g.prob_success, g.average_remaining_guesses)
+    converged_guesses = {guess_candidates[g.word]: (g.prob_success, g.average_remaining_guesses)
                          for g in init_state.alternative_next_guesses if converged(g)}
     print(str(len(converged_guesses)) + " first guesses converged: " + str(converged_guesses))
-    in_progress_guesses = {wordle_solutions[g.word]: (g.prob_success, g.average_remaining_guesses)
+    in_progress_guesses = {guess_candidates[g.word]: (g.prob_success, g.average_remaining_guesses)
                            for g in init_state.alternative_next_guesses
-                           if not converged(g) and g.prob_success[0] >= 0.5}
+                           if not converged(g) and 2 * g.wins[0] >= init_state.num_outcomes()}
     print(str(len(in_progress_guesses)) + " others with prob > 50%: " + str(in_progress_guesses))
 
 
@@ -1148,10 +2153,20 @@ def occasionally_print_progress():
 _ctp = 1
 def occasionally_write_policy():
     global _ctp
-    if _ctp % 50000 == 0:
-        write_cache_to_file('checkpoint_policy.bin', True)
+    if _ctp % checkpoint_interval == 0:
+        checkpoint()
+        write_endgame_table(endgame_table_filename())
     _ctp += 1
 
+_ctg = 1
+def occasionally_collect_garbage():
+    """ Evict unreachable States from the cache once in a while to keep memory from growing without bound. """
+    global _ctg
+    if collect_garbage and _ctg % gc_interval == 0:
+        evicted = collect_unreachable_states()
+        print("\nevicted " + str(evicted) + " unreachable states from the cache, " + str(cache_size()) + " remain\n")
+    _ctg += 1
+
 def done(s: State):
     """ Whether the search/exploration of the state is complete, and the search can quit. """
 
@@ -1160,20 +2175,57 @@ def done(s: State):
     return all_guesses_done(s)   # This won't return until the optimal policies of all first words are computed.
 
 def cmp(pp1, pp2):
-    """ Compare two pairs of floating point numbers while simply handling floating point error. """
-    d = pp2[0] - pp1[0]
-    if d >= 1e-12: return -1
-    if d <= -1e-12: return 1
-    d = pp2[1] - pp1[1]
-    if d >= 1e-12: return -1
-    if d <= -1e-12: return 1
+    """
+    Compare two pairs of integers, such as the wins of guesses from the same State.  Since the numbers are exact, no
+    tolerance is needed.
+    """
+    if pp1[0] < pp2[0]: return -1
+    if pp1[0] > pp2[0]: return 1
+    if pp1[1] < pp2[1]: return -1
+    if pp1[1] > pp2[1]: return 1
     return 0
 
+def cmp_fractions(n1, d1, n2, d2):
+    """ Compare n1/d1 with n2/d2 exactly by cross-multiplying the positive denominators. """
+    a = n1 * d2
+    b = n2 * d1
+    return -1 if a < b else (1 if a > b else 0)
+
+def cmp_prob(s1: State, s2: State):
+    """ Compare the (min, max) probabilities of winning of States with possibly different numbers of candidates. """
+    n1 = s1.num_outcomes()
+    n2 = s2.num_outcomes()
+    c = cmp_fractions(s1.wins[0], n1, s2.wins[0], n2)
+    if c != 0:
+        return c
+    return cmp_fractions(s1.wins[1], n1, s2.wins[1], n2)
+
+def cmp_avg(sg1, sg2):
+    """ Compare the (min, max) average numbers of guesses of two States or Guesses. """
+    c = cmp_fractions(sg1.total_guesses[0], sg1.wins[1], sg2.total_guesses[0], sg2.wins[1])
+    if c != 0:
+        return c
+    return cmp_fractions(sg1.total_guesses[1], sg1.wins[0], sg2.total_guesses[1], sg2.wins[0])
+
+def average_guesses(sg):
+    """ The (min, max) average number of guesses of the State or Guess as floats """
+    return (sg.total_guesses[0] / sg.wins[1] if sg.wins[1] else 0.0,
+            sg.total_guesses[1] / sg.wins[0] if sg.wins[0] else 0.0)
+
+def rescale_total(total: int, wins: int, new_wins: int, round_up: bool):
+    """
+    The total number of guesses for new_wins with the same average as total over wins, rounded down for an optimistic
+    total or up for a pessimistic one so that it stays a bound.
+    """
+    if round_up:
+        return -(-total * new_wins // wins)
+    return total * new_wins // wins
+
 def choose_guess(s: State):
     """ Choose which Guess to explore to find the next State to expand """
     i = 0
     g = s.alternative_next_guesses[i]  # we keep the guesses ordered as a priority queue
-    if optimize_for_winning and g.prev_state.num_prior_guesses > 0 and g.prob_success[1] <= s.prob_success[0] - 1e-12:
+    if is_inferior_guess(g):
         # bad guess
         print("\nInefficiently expanding inferior guess!\n")
     return g
@@ -1187,14 +2239,14 @@ def choose_state_from_guess( g: Guess ):
             best_state = cs
             continue
         if optimize_for_winning:
-            c = cmp(cs.prob_success, best_state.prob_success)
+            c = cmp_prob(cs, best_state)
             if c > 0:
                 best_state = cs
                 continue
             elif c < 0:
                 continue
         if minimize_guesses:
-            c = cmp(cs.average_remaining_guesses, best_state.average_remaining_guesses)
+            c = cmp_avg(cs, best_state)
             if c < 0:
                 best_state = cs
             elif c > 0:
@@ -1214,7 +2266,7 @@ def choose_state(s: State):
     expand_all_alternatives = True
     best_chance_of_reducing_uncertainty = False  # unimplemented -- not sure how this would work, but the thought is to get the min & max range narrowed as opposed to finding the best.
 
-    if expand_all_alternatives and len(s.alternative_next_guesses) < s.get_num_remaining_candidates():
+    if expand_all_alternatives and len(s.alternative_next_guesses) < s.get_num_guess_options():
         return s
 
     # get best scoring alternative guess that hasn't converged
@@ -1227,6 +2279,7 @@ def choose_state(s: State):
         time.sleep(10)
         print("\nfixing state: " + str(s))
         update_state_avg_num_guesses(s, best)
+        mark_dirty(s)
         print("\nfixed state: " + str(s))
         return None
 
@@ -1248,20 +2301,20 @@ def choose_state(s: State):
 
 
 def run():
-    """ Initialize the search and start running it. """
+    """ Initialize the search, resume it from the last checkpoint, and run it. """
     global init_state
+    global prior_cpu_time
+    global checkpoint_generation
     init_globals()
     init_state = State()
-    init_state.remaining_candidates = all_solution_candidates
+    init_state.remaining_candidates = all_guess_candidates if hard_mode else all_solution_candidates
+    init_state.wins = (0, len(wordle_solutions))
     init_state = get_or_cache_state(init_state)
-    # uncomment below and fix the file name to load a policy you saved away.
-    # tl_start = process_time()
-    # try:
-    #     replace_policy_from_file("checkpoint_policy.bin")
-    # except Exception as e:
-    #     print(str(e))
-    # add_time = process_time() - tl_start
-    # print("seconds elapsed to load policy from file = " + str(add_time))
+    read_endgame_table(endgame_table_filename())
+    prior_cpu_time = 0.0
+    checkpoint_generation = 0
+    if resume_runs:
+        resume_from_checkpoint()
     run_no_init()
 
 def run_no_init():
@@ -1272,13 +2325,15 @@ def run_no_init():
 
     if minimize_guesses:
         compute_num_guesses = True
+    materialize_all()
 
-    tl_start = process_time()
+    tl_start = process_time() - prior_cpu_time
 
     while not done(init_state):
         # Print out some feedback occasionally while the search is taking forever.
         occasionally_print_progress()
         occasionally_write_policy()
+        occasionally_collect_garbage()
 
         # choose and expand a state
         s: State = choose_state(init_state)
@@ -1287,12 +2342,16 @@ def run_no_init():
         if s:
             _ = expand(s)
 
+    checkpoint()  # so the finished policy can be loaded, even if it took fewer than checkpoint_interval iterations
+    wait_for_checkpoint()
     print_progress()  # print one last time at the end
+    write_compiled_policy()
+    write_endgame_table(endgame_table_filename())
     print("\ninit_state success probability = " + str(init_state.prob_success) +
           (", avg guesses = " + str(init_state.average_remaining_guesses) if compute_num_guesses else ""))
     if debug:
         for g in init_state.alternative_next_guesses:
-            print("prob success of choosing " + wordle_solutions[g.word] + " = " + str(g.prob_success) +
+            print("prob success of choosing " + guess_candidates[g.word] + " = " + str(g.prob_success) +
                   ("; avg guesses = " + str(g.average_remaining_guesses) if compute_num_guesses else ""))
     add_time = process_time() - tl_start
     print("seconds elapsed to build policy = " + str(add_time))
@@ -1309,20 +2368,8 @@ def expand(s: State):
     #     - Since more than one solution could map to the same State, keep track
     #       of which belong to which node or at least count them since that
     #       corresponds to the likelihood of reaching the node
-    pos = 0
-    n = 1
-    cands = s.remaining_candidates
-    while True:
-        candidate = nth_candidate(n, cands, pos, n-1)
-        if candidate == -1:
-            break
-        n += 1  # for the next iteration of this loop
-        pos = candidate + 1
-        won = g.word == candidate
-        if won:
-            child_remaining_candidates = 0
-        else:
-            child_remaining_candidates = cands & remaining_candidates[candidate][g.word]
+    for (child_remaining_candidates, count) in partition(s.remaining_candidates, g.word):
+        won = child_remaining_candidates == 0
         cached_state = get_state(s.num_prior_guesses + 1, child_remaining_candidates)
         is_new = False
         if cached_state is not None:
@@ -1333,45 +2380,48 @@ def expand(s: State):
             child.remaining_candidates = child_remaining_candidates
             child.num_prior_guesses = s.num_prior_guesses + 1
             child = get_or_cache_state(child)  # child should not change
-        if g not in child.incoming_guesses:
-            child.incoming_guesses.append( g )
-        if child in g.next_states.keys():
-            g.next_states[child] += 1
-        else:
-            g.next_states[child] = 1
-            if is_new:
-                # determine probability of success
-                # probability of winning on the next guess given remaining candidates are equally likely
-                child_prob = 1.0 / max(1, child.get_num_remaining_candidates())
-                # The worst case expected number of guesses is 1/2 of the remaining equally likely candidates,
-                # but it is capped by 6 total guesses.
+        child.incoming_guesses.append( g )  # g is new, and each child appears once in the partition
+        g.next_states[child] = count
+        if is_new and not won and (evaluate_endgame(child) or evaluate_closed_form(child)):
+            if debug:
+                print("evaluated exact policy for new child: " + str(child))
+        elif is_new:
+            # determine the wins
+            # one win on the next guess given remaining candidates are equally likely
+            child_n = child.num_outcomes()
+
+            if won or (optimize_for_winning and s.num_prior_guesses == 4):  # g was 5th guess and only 1 guess remaining
+                child.wins = (1, 1)
                 if compute_num_guesses:
-                    if not optimize_for_winning:
-                        avg_guesses = min(6.0 - s.num_prior_guesses - 1.0, max(1.0, child.get_num_remaining_candidates() / 2.0))
-                    else:
-                        avg_guesses = max(1.0, child.get_num_remaining_candidates() / 2.0)
-
-                if won or (optimize_for_winning and s.num_prior_guesses == 4):  # g was 5th guess and only 1 guess remaining
-                    child.prob_success = (child_prob, child_prob)
-                    if compute_num_guesses:
-                        child.average_remaining_guesses = (0.0, 0.0) if won else (avg_guesses, avg_guesses)
+                    # the only win is with the next guess
+                    child.total_guesses = (0, 0) if won else (1, 1)
+                if debug:
+                    print( "initializing guesses for new child to " + str( child.average_remaining_guesses ) + ": " + str(child))
+
+            elif not optimize_for_winning or s.num_prior_guesses < 4:
+                # with no limit on guesses, every candidate is eventually won
+                child.wins = (1, child_n) if optimize_for_winning else (child_n, child_n)
+                initial_totals = apply_initial_bounds(child)
+                seed_from_other_depths(child)
+                # Optimistically we either win on the next guess with probability = 1/child_n, or we are super
+                # smart and always use the next guess to identify the winner.  No need to cap since we have at least
+                # two guesses.
+                # Pessimistically, each guess only eliminates itself, and the remaining equally likely candidates are
+                # won in (1 + 2 + ... + child_n) / child_n = (child_n + 1) / 2 guesses on average.
+                if compute_num_guesses:
+                    (min_wins, max_wins) = child.wins
+                    optimistic_total = rescale_total(2 * child_n - 1, child_n, max_wins, False)
+                    pessimistic_total = rescale_total(child_n + 1, 2, min_wins, True)
+                    if initial_totals is not None:
+                        optimistic_total = max(optimistic_total, initial_totals[0])
+                        pessimistic_total = min(pessimistic_total, initial_totals[1])
+                    child.total_guesses = (optimistic_total, pessimistic_total)
                     if debug:
                         print( "initializing guesses for new child to " + str( child.average_remaining_guesses ) + ": " + str(child))
-
-                elif not optimize_for_winning or s.num_prior_guesses < 4:
-                    child.prob_success = (child_prob, 1.0)
-                    # Optimistically we either win on the next guess with probability = child_prob, or we are super
-                    # smart and always use the next guess to identify the winner.  No need to cap since we have at least
-                    # two guesses.
-                    if compute_num_guesses:
-                        optimistic_avg_guesses = (1.0 * child_prob + 2.0 * (1.0 - child_prob))
-                        child.average_remaining_guesses = (optimistic_avg_guesses, avg_guesses)
-                        if debug:
-                            print( "initializing guesses for new child to " + str( child.average_remaining_guesses ) + ": " + str(child))
-                else:
-                    raise Exception('Unexpected number of prior guesses, ' + str(s.num_prior_guesses) + ' > 4')
-                if debug:
-                    print("created child state: " + str(child))
+            else:
+                raise Exception('Unexpected number of prior guesses, ' + str(s.num_prior_guesses) + ' > 4')
+            if debug:
+                print("created child state: " + str(child))
     g.update_prob_success()
     if compute_num_guesses:
         g.update_average_remaining_guesses()
@@ -1379,85 +2429,775 @@ def expand(s: State):
     return g.next_states.keys()
 
 
-def update_guess_from_child_state_prob_success(guess: Guess, child_state: State, old_child_prob: tuple, new_child_prob: tuple):
+use_closed_form = True  # whether to directly evaluate states with two guesses left or a few remaining candidates
+closed_form_max_candidates = 8  # the most remaining candidates for checking for a perfect split at any depth
+closed_form_states = 0  # the number of States evaluated by evaluate_closed_form()
+
+def best_split(cands: int):
+    """
+    Find the guess that wins the most candidates with two guesses left: each set that it splits the other candidates
+    into is won on the last guess, plus the guess itself if it could be the solution.  Only the number of distinct
+    sets is needed, so no partition is kept.
+    :param cands: the bloom filter of the remaining candidates
+    :return: (word index of the best guess, wins, total guesses over the wins, most sets that any guess splits the
+    solutions into, not counting a win)
+    """
+    n = num_solutions(cands)
+    best = None
+    most_sets = 0
+    for word in guess_indices(cands):
+        if word >= len(wordle_solutions):
+            # a herring splits the solutions by feedback code, and none of them is a win
+            codes = feedback_codes[word]
+            num_sets = len({codes[candidate] for candidate in candidate_indices(cands & all_solution_candidates)})
+        else:
+            child_sets = set()
+            for candidate in candidate_indices(cands & all_solution_candidates):
+                if candidate != word:
+                    child_sets.add(cands & remaining_candidates[candidate][word])
+            num_sets = len(child_sets)
+        won = ((cands & all_solution_candidates) >> word) & 1  # herrings and, in easy mode, other words can't win
+        wins, total_guesses = won + num_sets, won + 2 * num_sets
+        most_sets = max(most_sets, num_sets)
+        if best is None or wins > best[1] or (wins == best[1] and total_guesses < best[2]):
+            best = (word, wins, total_guesses)
+            if wins == n and total_guesses == 2 * n - 1:
+                break  # every other candidate is identified, so nothing can do better
+    return best + (min(most_sets, n - 1),)
+
+def evaluate_closed_form(s: State):
+    """
+    Set exact, converged bounds on a new State without expanding it when the optimal policy can be computed directly.
+    - With two guesses left, each set that the first guess splits the other candidates into is won on the last
+      guess with probability 1/size, so the set adds exactly one win.  The best guess makes the most sets, winning
+      (1 + sets) of n in an average of (1 + 2 * sets) / (1 + sets) guesses.
+    - With a few candidates, if a guess identifies every other candidate, no policy can do better at any depth.
+    The best guess is added as the only alternative with no next states, so play() picks randomly (and optimally)
+    among the candidates left after it.
+    :return: whether the State was evaluated
+    """
+    global closed_form_states
+    if not use_closed_form or s.num_prior_guesses == 0 or s.remaining_candidates == 0:
+        return False
+    n = s.get_num_remaining_candidates()
+    two_guesses_left = optimize_for_winning and s.num_prior_guesses == 4
+    if not two_guesses_left and (n > closed_form_max_candidates or (optimize_for_winning and s.num_prior_guesses > 4)):
+        return False
+    (word, wins, total_guesses, _) = best_split(s.remaining_candidates)
+    if not two_guesses_left and (wins < n or total_guesses > 2 * n - 1):
+        return False
+    set_exact_policy(s, word, wins, total_guesses)
+    closed_form_states += 1
+    return True
+
+def set_exact_policy(s: State, word: int, wins: int, total_guesses: int):
+    """
+    Converge a State on an exactly computed policy by adding its best guess as the only alternative, with no next
+    states.
+    :param s: the State
+    :param word: the index of the best guess
+    :param wins: the number of remaining candidates won by the policy
+    :param total_guesses: the sum of the number of guesses (including the best guess) over the won candidates
+    """
+    s.wins = (wins, wins)
+    s.total_guesses = (total_guesses, total_guesses)
+    g = Guess()
+    g.word = word
+    g.prev_state = s
+    g.wins = (wins, wins)
+    g.total_guesses = (total_guesses - wins, total_guesses - wins)  # not counting the guess itself
+    s.alternative_next_guesses = [g]
+    mark_dirty(s)
+
+endgame_max_candidates = 12  # States with at most this many remaining candidates are looked up in (or added to) endgame_table
+endgame_table = {}  # (guesses left, remaining candidates) -> (wins, total guesses over the wins, best word index)
+endgame_hits = 0
+endgame_misses = 0
+
+def endgame_table_filename():
+    """
+    The file of endgame_table for the word lists and the settings that change its values: which words can be guessed
+    (easy mode and the herrings tried in hard mode) and whether there is a limit of six guesses.
+    """
+    settings = "" if hard_mode else "_easy"
+    if use_herrings and hard_mode:
+        settings += "_herrings_" + str(max_herring_guesses)
+    if not optimize_for_winning:
+        settings += "_unlimited"
+    return cache_path("endgame_table" + settings + ".bin", *guess_word_lists())
+
+def guesses_left(num_prior_guesses: int, num_candidates: int):
+    """
+    The number of guesses that can still be used to win.  Since every guess in hard mode eliminates at least itself,
+    more guesses than candidates never helps, so this is capped by the number of candidates.  That also makes it
+    the number of candidates when there is no limit on guesses.
+    """
+    if not optimize_for_winning:
+        return num_candidates
+    return min(6 - num_prior_guesses, num_candidates)
+
+def solve_endgame(cands: int, num_guesses_left: int):
+    """
+    Exhaustively solve a (small) candidate set, maximizing wins and then minimizing the number of guesses.  Results
+    are memoized in endgame_table for every subset solved along the way.
+    :param cands: the bloom filter of the remaining candidates
+    :param num_guesses_left: the number of guesses that can be used
+    :return: (wins, total guesses over the wins, best word index)
+    """
+    global endgame_hits
+    global endgame_misses
+    n = num_solutions(cands)
+    num_guesses_left = min(num_guesses_left, n)
+    key = (num_guesses_left, cands)
+    e = endgame_table.get(key)
+    if e is not None:
+        endgame_hits += 1
+        return e
+    endgame_misses += 1
+    if n == 1 or num_guesses_left == 1:
+        e = (1, 1, next(candidate_indices(cands)))
+    elif num_guesses_left == 2:
+        (word, wins, total_guesses, _) = best_split(cands)
+        e = (wins, total_guesses, word)
+    else:
+        for word in guess_indices(cands):
+            wins = 0
+            total_guesses = 0
+            for (child, count) in compute_partition(cands, word):
+                if child == 0:
+                    wins += 1  # the guess is the solution
+                    total_guesses += 1
+                else:
+                    (child_wins, child_total_guesses, _) = solve_endgame(child, num_guesses_left - 1)
+                    wins += child_wins
+                    total_guesses += child_total_guesses + child_wins  # add this guess for each win
+            if e is None or wins > e[0] or (wins == e[0] and total_guesses < e[1]):
+                e = (wins, total_guesses, word)
+                if wins == n and total_guesses == 2 * n - 1:
+                    break  # every other candidate is identified by the guess, so nothing can do better
+    endgame_table[key] = e
+    return e
+
+def evaluate_endgame(s: State):
+    """
+    Converge a new State with few remaining candidates on its exact policy from endgame_table.
+    :return: whether the State was evaluated
+    """
+    if s.num_prior_guesses == 0 or s.remaining_candidates == 0:
+        return False
+    n = s.get_num_remaining_candidates()
+    if n > endgame_max_candidates:
+        return False
+    (wins, total_guesses, word) = solve_endgame(s.remaining_candidates, guesses_left(s.num_prior_guesses, n))
+    set_exact_policy(s, word, wins, total_guesses)
+    return True
+
+def build_endgame_table(max_candidates: int = None, max_depth: int = 2, filename: str = None):
+    """
+    Precompute endgame_table for the candidate sets of up to max_candidates words that are reachable within
+    max_depth guesses, solving each for every number of guesses left, and write it to file.  Larger sets are
+    split further until max_depth.  This assumes init_globals() has been called.
+    """
+    global endgame_max_candidates
+    if max_candidates is not None:
+        endgame_max_candidates = max_candidates
+    tl = process_time()
+    level = {all_solution_candidates}
+    for depth in range(max_depth):
+        next_level = set()
+        for cands in level:
+            for word in guess_indices(cands):
+                for (child, count) in compute_partition(cands, word):
+                    if child == 0:
+                        continue
+                    n = num_solutions(child)
+                    if n <= endgame_max_candidates:
+                        for num_guesses_left in range(2, 6 - depth):
+                            solve_endgame(child, num_guesses_left if optimize_for_winning else n)
+                    else:
+                        next_level.add(child)
+        print("endgame table has " + str(len(endgame_table)) + " entries after depth " + str(depth + 1) + ", " +
+              str(len(next_level)) + " larger sets, " + str(process_time() - tl) + " CPU seconds")
+        level = next_level
+    write_endgame_table(filename if filename else endgame_table_filename())
+
+def write_endgame_table(filename: str):
+    """ Write endgame_table to file so that other runs don't have to solve the same endgames. """
+    write_cached(filename, word_list_key(*guess_word_lists()), endgame_table)
+
+def read_endgame_table(filename: str):
+    """ Merge the endgame table in the file into endgame_table, if the file exists for the same word lists. """
+    table = read_cached(filename, word_list_key(*guess_word_lists()))
+    if table is not None:
+        endgame_table.update(table)
+
+use_initial_bounds = True  # whether to compute tighter bounds for new States than those from the number of candidates
+initial_bounds_max_candidates = 100  # larger States get the default bounds since computing them takes O(n^2) per guess
+rollout_heuristic = 'min_max_set'  # the default heuristic for greedy_guess(): 'min_max_set', 'most_sets', or 'entropy'
+rollout_heuristics = ['min_max_set', 'most_sets', 'entropy']  # all of the heuristics of heuristic_key()
+rollout_table = {}  # (heuristic, guesses left, remaining candidates) -> (wins, total guesses over the wins, first word) for greedy_rollout()
+rollout_table_max_size = 1000000  # rollout_table is cleared when it gets bigger than this
+
+def heuristic_key(p: list, heuristic: str):
+    """
+    Score the partition of candidates by a guess for greedy_guess(), where lower is better.
+    - 'min_max_set': the smallest largest set, breaking ties by making more sets
+    - 'most_sets': the most sets, breaking ties by the smallest largest set
+    - 'entropy': the most information, which is the smallest sum of count * log(count) since the total count is the
+      same for all guesses
+    """
+    if heuristic == 'most_sets':
+        return (-len(p), max(count for (child, count) in p))
+    if heuristic == 'entropy':
+        return sum(count * math.log(count) for (child, count) in p)
+    return (max(count for (child, count) in p), -len(p))
+
+def greedy_guess(cands: int, heuristic: str = None):
+    """
+    A cheap heuristic choice of guess among the candidates.  See heuristic_key() for the heuristics.
+    :return: (word index, partition of the candidates by the guess)
+    """
+    if heuristic is None:
+        heuristic = rollout_heuristic
+    best = None
+    best_key = None
+    for word in guess_indices(cands):
+        p = compute_partition(cands, word)
+        key = heuristic_key(p, heuristic)
+        if best_key is None or key < best_key:
+            best = (word, p)
+            best_key = key
+    return best
+
+def greedy_rollout(cands: int, num_guesses_left: int, heuristic: str = None):
+    """
+    Play out the greedy_guess() policy from the candidates.  Since it is a policy that could be followed, its wins are
+    a lower bound on the optimal wins.  Small sets are solved exactly with solve_endgame(), which only tightens the
+    bound.  The policy is remembered in rollout_table and endgame_table; see rollout_policy().
+    :return: (wins, total guesses over the wins, first word index)
+    """
+    if heuristic is None:
+        heuristic = rollout_heuristic
+    n = num_solutions(cands)
+    num_guesses_left = min(num_guesses_left, n)
+    if n <= endgame_max_candidates or num_guesses_left <= 2:
+        return solve_endgame(cands, num_guesses_left)
+    key = (heuristic, num_guesses_left, cands)
+    r = rollout_table.get(key)
+    if r is not None:
+        return r
+    (word, p) = greedy_guess(cands, heuristic)
+    wins = 0
+    total_guesses = 0
+    for (child, count) in p:
+        if child == 0:
+            wins += 1  # the guess is the solution
+            total_guesses += 1
+        else:
+            (child_wins, child_total_guesses, _) = greedy_rollout(child, num_guesses_left - 1, heuristic)
+            wins += child_wins
+            total_guesses += child_total_guesses + child_wins
+    r = (wins, total_guesses, word)
+    if len(rollout_table) >= rollout_table_max_size:
+        rollout_table.clear()
+    rollout_table[key] = r
+    return r
+
+def rollout_policy(cands: int, num_guesses_left: int, heuristic: str = None, policy: dict = None):
+    """
+    Extract the complete policy played by greedy_rollout() from the candidates.
+    :return: a dictionary, (guesses left, remaining candidates) -> word index of the guess, including the states
+    after the guesses
+    """
+    if policy is None:
+        policy = {}
+    n = num_solutions(cands)
+    num_guesses_left = min(num_guesses_left, n)
+    if num_guesses_left <= 0 or (num_guesses_left, cands) in policy:
+        return policy
+    word = greedy_rollout(cands, num_guesses_left, heuristic)[2]
+    policy[(num_guesses_left, cands)] = word
+    for (child, count) in compute_partition(cands, word):
+        if child != 0:
+            rollout_policy(child, num_guesses_left - 1, heuristic, policy)
+    return policy
+
+def rollout_opener(word: int, heuristic: str = None):
+    """
+    Evaluate the greedy_rollout() policy after the first guess.
+    :return: (wins, total guesses over the wins) for all solutions
+    """
+    wins = 0
+    total_guesses = 0
+    for (child, count) in compute_partition(all_solution_candidates, word):
+        if child == 0:
+            wins += 1  # the guess is the solution
+            total_guesses += 1
+        else:
+            (child_wins, child_total_guesses, _) = greedy_rollout(child, guesses_left(1, count), heuristic)
+            wins += child_wins
+            total_guesses += child_total_guesses + child_wins
+    return wins, total_guesses
+
+def _rollout_opener_worker(args):
+    """ Evaluate an opener in a worker process for rollout_openers(), returning the rollouts after it if seeding. """
+    (word, heuristic, seed) = args
+    (wins, total_guesses) = rollout_opener(word, heuristic)
+    seeds = []
+    if seed:
+        h = heuristic if heuristic is not None else rollout_heuristic
+        for (child, count) in compute_partition(all_solution_candidates, word):
+            key = (h, min(guesses_left(1, count), count), child)
+            if key in rollout_table:
+                seeds.append((key, rollout_table[key]))
+    return word, wins, total_guesses, seeds
+
+def rollout_openers(words: list = None, heuristic: str = None, processes: int = None, seed: bool = False):
+    """
+    Quickly build a complete greedy policy for each first guess and evaluate it.  This gives an approximate ranking
+    of first guesses in minutes instead of the hours that the exact search takes per guess.  The win probabilities
+    are lower bounds on those of the optimal policies.  This assumes init_globals() has been called.
+    :param words: the first guesses (strings or indices) to evaluate, all solutions by default
+    :param heuristic: the heuristic for greedy_guess(), rollout_heuristic by default
+    :param processes: the number of worker processes; None for one per CPU, or 1 to run in this process
+    :param seed: whether to add the rollouts after each first guess to rollout_table so that the exact search uses
+    them as lower bounds for new States, even if they have more than initial_bounds_max_candidates candidates
+    :return: a dictionary, first guess word -> (probability of winning, average number of guesses for the wins)
+    """
+    if words is None:
+        words = range(len(wordle_solutions))
+    words = [word_indices[w] if type(w) == str else w for w in words]
+    tl = process_time()
+    args = [(w, heuristic, seed) for w in words]
+    if processes == 1:
+        results = [_rollout_opener_worker(a) for a in args]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_rollout_opener_worker, args, chunksize=max(1, len(args) // (8 * (processes or os.cpu_count()))))
+    evaluations = {}
+    for (word, wins, total_guesses, seeds) in results:
+        evaluations[wordle_solutions[word]] = (wins / len(wordle_solutions), total_guesses / wins)
+        for (key, r) in seeds:
+            rollout_table[key] = r
+    print("seconds elapsed for rollouts of " + str(len(words)) + " first guesses = " + str(process_time() - tl) +
+          " (only counting this process)")
+    return evaluations
+
+def print_rollout_ranking(evaluations: dict, top: int = 20):
+    """ Print the best first guesses from rollout_openers() by probability of winning and then average guesses. """
+    ranked = sorted(evaluations.items(), key=lambda item: (-item[1][0], item[1][1]))
+    for (word, (prob, avg)) in ranked[0:top]:
+        print(word + ": p = " + str(prob) + ", avg guesses = " + str(avg))
+
+def max_wins(n: int, num_sets: int, num_guesses_left: int):
+    """
+    An upper bound on the wins for n candidates when no guess splits the others into more than num_sets sets.  Sets
+    of a later guess are subsets of those made by the same word from all n candidates, so they can't be split into
+    more than num_sets either.  With one guess left, one is won, and with k guesses left, at most
+    1 + num_sets * max_wins(k - 1) are won.
+    """
+    wins = 1
+    for _ in range(num_guesses_left - 1):
+        wins = min(n, 1 + num_sets * wins)
+    return min(n, wins)
+
+def initial_bounds(s: State):
+    """
+    Admissible bounds for a new State from a greedy rollout and from the most sets any guess can split it into.
+    :return: ((min wins, max wins), (min total guesses, max total guesses)) where the total guesses are None when
+    optimizing for winning, since there the average is only over the wins of the policy.
+    """
+    n = s.get_num_remaining_candidates()
+    num_guesses_left = guesses_left(s.num_prior_guesses, n)
+    (_, _, _, num_sets) = best_split(s.remaining_candidates)
+    (wins, total_guesses, _) = greedy_rollout(s.remaining_candidates, num_guesses_left)
+    wins = (wins, max_wins(n, num_sets, num_guesses_left))
+    totals = None
+    if not optimize_for_winning:
+        # Every candidate is won.  At best, one is won with the first guess, one for each set with the second, and
+        # the rest with the third.  The greedy policy's average can't be better than the best policy.
+        min_total_guesses = 1 + 2 * num_sets + 3 * (n - 1 - num_sets)
+        totals = (min_total_guesses, total_guesses)
+    return wins, totals
+
+def apply_initial_bounds(s: State):
+    """
+    Tighten the default wins of a new State with initial_bounds().  Larger States only use a rollout that is
+    already in rollout_table, such as those seeded by rollout_openers() with any heuristic.
+    :return: the (min, max) total guesses from initial_bounds() or None
+    """
+    if not use_initial_bounds or s.num_prior_guesses == 0:
+        return None
+    n = s.get_num_remaining_candidates()
+    if n > initial_bounds_max_candidates:
+        num_guesses_left = guesses_left(s.num_prior_guesses, n)
+        # every rollout is a policy that could be followed, whichever heuristic it was built with
+        wins = max([r[0] for r in [rollout_table.get((h, num_guesses_left, s.remaining_candidates))
+                                   for h in rollout_heuristics] if r is not None], default=s.wins[0])
+        if wins > s.wins[0]:
+            s.wins = (wins, s.wins[1])
+            s.wins_bounds = s.wins
+        return None
+    (wins, totals) = initial_bounds(s)
+    s.wins = (max(s.wins[0], wins[0]), min(s.wins[1], wins[1]))
+    s.wins_bounds = s.wins
+    return totals
+
+def check_initial_bounds():
+    """
+    Check that initial_bounds() contains the converged wins (and the total guesses when not optimizing for
+    winning) of every converged State in the cache.  This is for validating the bounds with small word lists after
+    searching without them (use_initial_bounds = False).
+    :return: the number of States whose values are outside of their bounds
+    """
+    num_checked = 0
+    num_bad = 0
+    for inner in state_cache:
+        for s in inner.values():
+            if s.num_prior_guesses == 0 or s.remaining_candidates == 0 or not converged(s):
+                continue
+            num_checked += 1
+            (wins, totals) = initial_bounds(s)
+            bad = s.wins[0] < wins[0] or s.wins[1] > wins[1]
+            if totals is not None:
+                bad = bad or s.total_guesses[0] < totals[0] or s.total_guesses[1] > totals[1]
+            if bad:
+                num_bad += 1
+                print("bounds " + str((wins, totals)) + " don't contain the values of state " + str(s))
+    print(str(num_bad) + " of " + str(num_checked) + " converged states are outside of their initial bounds")
+    return num_bad
+
+minimax_table = {}  # (guesses left, remaining candidates) -> word index of a guess that always wins in time, or -1 if none
+
+def can_always_win(cands: int, num_guesses_left: int):
+    """
+    Whether there is a policy that wins for every one of the candidates within the number of guesses left.  This
+    is a depth-first search that gives up on a guess as soon as one of its sets can't always be won, trying the
+    guesses with the smallest largest sets first.  Results are memoized in minimax_table, where the guess found is a
+    witness for the policy.
+    """
+    n = num_solutions(cands)
+    if n == 0:
+        return True
+    if num_guesses_left <= 0:
+        return False  # even a single candidate takes a guess
+    if n == 1:
+        return True
+    if num_guesses_left == 1:
+        return False
+    key = (num_guesses_left, cands)
+    word = minimax_table.get(key)
+    if word is not None:
+        return word >= 0
+    word = -1
+    if num_guesses_left >= n:
+        word = next(candidate_indices(cands))  # every guess eliminates at least itself
+    else:
+        partitions = [(w, compute_partition(cands, w)) for w in guess_indices(cands)]
+        num_sets = max(sum(1 for (child, count) in p if child != 0) for (w, p) in partitions)  # not counting the win
+        if max_wins(n, num_sets, num_guesses_left) >= n:
+            partitions.sort(key=lambda wp: max(count for (child, count) in wp[1]))
+            for (w, p) in partitions:
+                if max(count for (child, count) in p) > max_wins(n, num_sets, num_guesses_left - 1):
+                    break  # this and the remaining guesses leave a set too big to always win
+                if all(child == 0 or can_always_win(child, num_guesses_left - 1)
+                       for (child, count) in sorted(p, key=lambda cc: -cc[1])):
+                    word = w
+                    break
+    minimax_table[key] = word
+    return word >= 0
+
+def minimax_policy(cands: int, num_guesses_left: int, policy: dict = None):
+    """
+    Extract the witness policy found by can_always_win() for the candidates.
+    :return: a dictionary, (guesses left, remaining candidates) -> word index of the guess
+    """
+    if policy is None:
+        policy = {}
+    if num_solutions(cands) == 1:
+        policy[(num_guesses_left, cands)] = next(candidate_indices(cands))
+        return policy
+    can_always_win(cands, num_guesses_left)  # the sets of a guess that was found without searching aren't in the table yet
+    word = minimax_table[(num_guesses_left, cands)]
+    policy[(num_guesses_left, cands)] = word
+    for (child, count) in compute_partition(cands, word):
+        if child != 0:
+            minimax_policy(child, num_guesses_left - 1, policy)
+    return policy
+
+def minimax_opener(word: int, max_guesses: int = 6):
+    """
+    Find the fewest guesses within which the first guess can always win by iterative deepening.
+    :return: the number of guesses, or None if it can't always win within max_guesses
+    """
+    children = [child for (child, count) in compute_partition(all_solution_candidates, word) if child != 0]
+    children.sort(key=lambda c: -num_solutions(c))
+    for num_guesses in range(1, max_guesses + 1):
+        if all(can_always_win(child, num_guesses - 1) for child in children):
+            return num_guesses
+    return None
+
+def minimax_opener_policy(word: int, num_guesses: int):
+    """ The witness policy for a first guess that always wins within num_guesses, as in minimax_policy(). """
+    policy = {(num_guesses, all_solution_candidates): word}
+    for (child, count) in compute_partition(all_solution_candidates, word):
+        if child != 0:
+            minimax_policy(child, num_guesses - 1, policy)
+    return policy
+
+def _minimax_opener_worker(args):
+    """ Find the guaranteed number of guesses (and policy) for a first guess in a worker of minimax_openers(). """
+    (word, max_guesses, with_policies) = args
+    num_guesses = minimax_opener(word, max_guesses)
+    policy = minimax_opener_policy(word, num_guesses) if with_policies and num_guesses is not None else None
+    return word, num_guesses, policy
+
+def minimax_openers(words: list = None, max_guesses: int = 6, processes: int = None, with_policies: bool = False):
+    """
+    Answer whether each first guess can always win within max_guesses, and if so, in how few guesses.  This
+    ignores probabilities and averages, so it is much faster than run() with optimize_for_winning.  This assumes
+    init_globals() has been called.
+    :param words: the first guesses (strings or indices) to check, all solutions by default
+    :param max_guesses: the most guesses allowed
+    :param processes: the number of worker processes; None for one per CPU, or 1 to run in this process
+    :param with_policies: whether to include a witness policy for each first guess that always wins
+    :return: a dictionary, first guess word -> (fewest guesses always winning or None, policy or None), where a
+    policy is a dictionary as in minimax_policy()
+    """
+    if words is None:
+        words = range(len(wordle_solutions))
+    words = [word_indices[w] if type(w) == str else w for w in words]
+    tl = process_time()
+    args = [(w, max_guesses, with_policies) for w in words]
+    if processes == 1:
+        results = [_minimax_opener_worker(a) for a in args]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_minimax_opener_worker, args, chunksize=max(1, len(args) // (8 * (processes or os.cpu_count()))))
+    always_win = {wordle_solutions[word]: (num_guesses, policy) for (word, num_guesses, policy) in results}
+    print("seconds elapsed for minimax of " + str(len(words)) + " first guesses = " + str(process_time() - tl) +
+          " (only counting this process)")
+    return always_win
+
+retrograde_batch_size = 1000  # the number of States solved together by a worker process in retrograde_solve()
+_retrograde_next_values = {}  # remaining candidates -> (wins, total guesses, word) for the level after the one being solved
+
+def terminal_value(cands: int, num_prior_guesses: int):
+    """
+    The exact value of the candidates after the number of guesses if it doesn't need the values of other States,
+    which is when there are few candidates or at most two guesses left.
+    :return: (wins, total guesses over the wins, best word index), or None if the value needs to be searched
+    """
+    n = num_solutions(cands)
+    num_guesses_left = guesses_left(num_prior_guesses, n)
+    if n <= endgame_max_candidates or num_guesses_left <= 1:
+        return solve_endgame(cands, num_guesses_left)
+    if num_guesses_left == 2:
+        (word, wins, total_guesses, _) = best_split(cands)  # not kept in endgame_table since large sets would take a lot of memory
+        return (wins, total_guesses, word)
+    return None
+
+def retrograde_level_filename(depth: int, kind: str):
+    return cache_path("retrograde_" + kind + "_" + str(depth) + ".bin", *guess_word_lists())
+
+def spill_level(obj, depth: int, kind: str):
+    """ Write a level of retrograde_solve() to disk so that it doesn't take memory while other levels are processed. """
+    with open(retrograde_level_filename(depth, kind), 'wb') as f:
+        pickle.dump(obj, f)
+
+def load_level(depth: int, kind: str):
+    with open(retrograde_level_filename(depth, kind), 'rb') as f:
+        return pickle.load(f)
+
+def remove_levels():
+    """ Remove the files of the levels spilled by retrograde_solve() """
+    depth = 0
+    while any(os.path.exists(retrograde_level_filename(depth, kind)) for kind in ["states", "values"]):
+        for kind in ["states", "values"]:
+            if os.path.exists(retrograde_level_filename(depth, kind)):
+                os.remove(retrograde_level_filename(depth, kind))
+        depth += 1
+
+def retrograde_enumerate():
+    """
+    Breadth-first enumeration of the reachable States that need to be searched (those without a terminal_value()),
+    deduplicated by remaining candidates within each level.  Each level is spilled to disk once the next is
+    enumerated.
+    :return: the number of levels
+    """
+    tl = process_time()
+    level = [all_solution_candidates]
+    depth = 0
+    while level:
+        next_level = set()
+        for cands in level:
+            for word in guess_indices(cands):
+                for (child, count) in partition(cands, word):
+                    if child != 0 and child not in next_level and terminal_value_needed(child, depth + 1):
+                        next_level.add(child)
+        spill_level(level, depth, "states")
+        print("retrograde level " + str(depth) + " has " + str(len(level)) + " states to solve, " +
+              str(process_time() - tl) + " CPU seconds")
+        level = sorted(next_level)
+        depth += 1
+    return depth
+
+def terminal_value_needed(cands: int, num_prior_guesses: int):
+    """ Whether the State is searched by retrograde_solve() rather than having a terminal_value(). """
+    n = num_solutions(cands)
+    return n > endgame_max_candidates and guesses_left(num_prior_guesses, n) > 2
+
+def _retrograde_value(cands: int, num_prior_guesses: int, word: int):
+    """ The value of a guess from a searched State using the values of the next level. """
+    wins = 0
+    total_guesses = 0
+    for (child, count) in partition(cands, word):
+        if child == 0:
+            wins += 1  # the guess is the solution
+            total_guesses += 1
+        else:
+            v = _retrograde_next_values.get(child)
+            if v is None:
+                v = terminal_value(child, num_prior_guesses + 1)
+            wins += v[0]
+            total_guesses += v[1] + v[0]
+    return wins, total_guesses
+
+def _retrograde_solve_batch(args):
+    """ Solve a batch of States at the same depth in a worker of retrograde_solve(). """
+    (batch, depth) = args
+    values = []
+    for cands in batch:
+        best = None
+        for word in guess_indices(cands):
+            (wins, total_guesses) = _retrograde_value(cands, depth, word)
+            if best is None or wins > best[0] or (wins == best[0] and total_guesses < best[1]):
+                best = (wins, total_guesses, word)
+        values.append((cands, best))
+    return values
+
+def retrograde_solve(processes: int = 1):
+    """
+    An alternative to run() that solves the policy bottom-up: first enumerate the reachable States level by level,
+    then solve each level exactly from the deepest back to the root using the values of the level below.  Each
+    level is solved in batches (in parallel if processes != 1), and levels are spilled to files in the cache
+    directory, so memory only holds about two levels at a time.  The files are removed when it finishes.  This
+    assumes init_globals() has been called.
+    :param processes: the number of worker processes; None for one per CPU
+    :return: a dictionary, first guess word -> (probability of winning, average number of guesses for the wins),
+    comparable with results.txt; see write_retrograde_results()
+    """
+    global _retrograde_next_values
+    tl = process_time()
+    try:
+        num_levels = retrograde_enumerate()
+        _retrograde_next_values = {}
+        for depth in range(num_levels - 1, 0, -1):
+            level = load_level(depth, "states")
+            batches = [(level[i:i + retrograde_batch_size], depth) for i in range(0, len(level), retrograde_batch_size)]
+            if processes == 1:
+                results = [_retrograde_solve_batch(b) for b in batches]
+            else:
+                with multiprocessing.Pool(processes) as pool:  # forked after the next level's values are loaded
+                    results = pool.map(_retrograde_solve_batch, batches)
+            values = {cands: v for batch_values in results for (cands, v) in batch_values}
+            spill_level(values, depth, "values")
+            _retrograde_next_values = values
+            print("retrograde level " + str(depth) + " solved, " + str(process_time() - tl) + " CPU seconds")
+        first_guesses = {}
+        for word in candidate_indices(all_solution_candidates):
+            (wins, total_guesses) = _retrograde_value(all_solution_candidates, 0, word)
+            first_guesses[wordle_solutions[word]] = (wins / len(wordle_solutions), total_guesses / wins)
+        _retrograde_next_values = {}
+    finally:
+        remove_levels()
+    print("seconds elapsed for retrograde solution = " + str(process_time() - tl) + " (only counting this process)")
+    return first_guesses
+
+def write_retrograde_results(first_guesses: dict, filename: str = 'retrograde_results.txt'):
+    """ Write the probabilities from retrograde_solve() in the format of results.txt. """
+    with open(filename, 'w') as f:
+        f.write("# The probabilities of optimal policies for first guesses to win in 6 guesses:\n")
+        f.write(json.dumps({word: prob for (word, (prob, avg)) in first_guesses.items()}, indent=4))
+
+def update_guess_from_child_state_prob_success(guess: Guess, child_state: State, old_child_wins: tuple, new_child_wins: tuple):
     '''
-    Update guess `prob_success` from its child state's `prob_success`.  Assumes child state is already in `guess.next_states`,
-    and the child's old `prob_success` (`old_child_prob`) is reflected in the guess's `prob_success`.
-    Return whether the guess's prob_success changed.
+    Update guess `wins` from its child state's `wins`.  Assumes child state is already in `guess.next_states`,
+    and the child's old `wins` (`old_child_wins`) is reflected in the guess's `wins`.  Since the wins are integers,
+    swapping the child's old wins for the new ones is exact.
+    Return whether the guess's wins changed.
     :param guess:
-    :param old_child_prob:
-    :param new_child_prob:
+    :param old_child_wins:
+    :param new_child_wins:
     :return:
     '''
     if guess is None:
         return
-    old_prob = guess.prob_success
-    num_child_states = sum(guess.next_states.values())
-    num_occs = guess.next_states[child_state]  # This assumes that the child has already been added to g.next_states
-
-    min_prob = (new_child_prob[0] * num_occs - old_child_prob[0] * num_occs + old_prob[0] * num_child_states) / num_child_states
-    max_prob = (new_child_prob[1] * num_occs - old_child_prob[1] * num_occs + old_prob[1] * num_child_states) / num_child_states
+    old_wins = guess.wins
+    min_wins = old_wins[0] + new_child_wins[0] - old_child_wins[0]
+    max_wins = old_wins[1] + new_child_wins[1] - old_child_wins[1]
     if debug:
         print( "update_guess_from_child_state_prob_success(" + str(guess.word) + ") from " +
-               str( guess.prob_success ) + " to " + str((min_prob, max_prob)) +
+               str( guess.wins ) + " to " + str((min_wins, max_wins)) +
                " for child state " + str(child_state.remaining_candidates))
-    guess.prob_success = (min_prob, max_prob)
-    if cmp(guess.prob_success, old_prob) == 0:
+    guess.wins = (min_wins, max_wins)
+    if guess.wins == old_wins:
         return False
     return True
 
-# HERE!!!!!!!!
-def update_guess_from_child_state_average_remaining_guesses(guess: Guess, child_state: State, old_child_avg: tuple, new_child_avg: tuple):
+def update_guess_from_child_state_average_remaining_guesses(guess: Guess, child_state: State, old_child_total: tuple, new_child_total: tuple):
     '''
-    Update guess `average_remaining_guesses` from its child state's `average_remaining_guesses`.  Assumes child state is already in `guess.next_states`,
-    and the child's old `average_remaining_guesses` (`old_child_prob`) is reflected in the guess's `average_remaining_guesses`.
-    Return whether the guess's average_remaining_guesses changed.
+    Update guess `total_guesses` from its child state's `total_guesses`.  Assumes child state is already in `guess.next_states`,
+    and the child's old `total_guesses` (`old_child_total`) is reflected in the guess's `total_guesses`.
+    Since the guess's totals are just the sums of those of its next states (see Guess.update_average_remaining_guesses()),
+    swapping the child's old totals for the new ones is exact, even when the wins have changed.
+    Return whether the guess's total_guesses changed.
     :param guess:
-    :param old_child_prob:
-    :param new_child_prob:
+    :param old_child_total:
+    :param new_child_total:
     :return:
     '''
     if guess is None:
         return
     if not compute_num_guesses:
         return
-    old_avg = guess.average_remaining_guesses
-    # The hard way (below and wrong) may be too complicated since the probabilities changed, so
-    # we're doing it the less efficient, easy way.
-    guess.update_average_remaining_guesses()
-    # num_child_states = sum(guess.next_states.values())
-    # num_occs = guess.next_states[child_state]  # This assumes that the child has already been added to g.next_states
-    #
-    # min_prob = (new_child_avg[0] * num_occs - old_child_avg[0] * num_occs + old_avg[0] * num_child_states) / num_child_states
-    # max_prob = (new_child_avg[1] * num_occs - old_child_avg[1] * num_occs + old_avg[1] * num_child_states) / num_child_states
-    # guess.average_remaining_guesses = (min_prob, max_prob)
-    if cmp(guess.average_remaining_guesses, old_avg) == 0:
+    old_total = guess.total_guesses
+    guess.total_guesses = (old_total[0] + new_child_total[0] - old_child_total[0],
+                           old_total[1] + new_child_total[1] - old_child_total[1])
+    if debug:
+        print( "update_guess_from_child_state_average_remaining_guesses(" + str(guess.word) + ") from " +
+               str( old_total ) + " to " + str(guess.total_guesses) +
+               " for child state " + str(child_state.remaining_candidates))
+    if guess.total_guesses == old_total:
         return False
     return True
 
 def update_state_prob_success(s: State, alt_guess: Guess):
     '''
-    Update the parent state's prob_success based on an update to that of one of the alternative next guesses.
-    A state's prob_success is the max of those of its alternative guesses in that state.
+    Update the parent state's wins based on an update to that of one of the alternative next guesses.
+    A state's wins are the max of those of its alternative guesses in that state.
     :param s:
     :param alt_guess:
     :return:
     '''
-    old_prob = s.prob_success
+    old_wins = s.wins
     heapq.heapify(s.alternative_next_guesses)  # TODO -- this could be more efficient since only alt_guess changed; just do rotations on own here instead of relying on heapq
-    # example: if alternative probs are [(0.0, 1.0), (0.1, 0.2)] then the parent is (0.1, 1.0)
-    min_prob = max(ang.prob_success[0] for ang in s.alternative_next_guesses)
-    all_alts = not (len(s.alternative_next_guesses) < s.get_num_remaining_candidates())
+    # example: if alternative wins are [(0, 10), (1, 2)] then the parent is (1, 10)
+    min_wins = max(ang.wins[0] for ang in s.alternative_next_guesses)
+    all_alts = not (len(s.alternative_next_guesses) < s.get_num_guess_options())
     if not all_alts:
-        max_prob = 1.0
+        max_wins = s.num_outcomes()
     else:
-        max_prob = max(ang.prob_success[1] for ang in s.alternative_next_guesses)
-    s.prob_success = (min_prob, max_prob)
+        max_wins = max(ang.wins[1] for ang in s.alternative_next_guesses)
+    if s.wins_bounds is not None:
+        min_wins = max(min_wins, s.wins_bounds[0])
+        max_wins = min(max_wins, s.wins_bounds[1])
+    s.wins = (min_wins, max_wins)
     if debug:
-        print("update_state_prob_success(): from " + str( old_prob ) + " to " + str( s.prob_success ) +
+        print("update_state_prob_success(): from " + str( old_wins ) + " to " + str( s.wins ) +
               " for State: " + str(s) + " for " + str(len(s.alternative_next_guesses)) + " out of " +
               str(s.get_num_remaining_candidates()))
-    if cmp(old_prob, s.prob_success) == 0:
+    if old_wins == s.wins:
         return False
     return True
 
@@ -1468,22 +3208,23 @@ def propagate_guess_to_state(s: State, alt_guess: Guess, skip_prob: bool = False
     :param alt_guess:
     :return:
     '''
-    old_prob = s.prob_success
+    mark_dirty(s)
+    old_wins = s.wins
     if skip_prob:
         changed_prob = False
     else:
         changed_prob = update_state_prob_success(s, alt_guess)
     changed_avg_num_guesses = False
     if compute_num_guesses:
-        old_avg = s.average_remaining_guesses
+        old_total = s.total_guesses
         changed_avg_num_guesses = update_state_avg_num_guesses(s, alt_guess)
     if changed_prob or changed_avg_num_guesses:
         for g in s.incoming_guesses:
             if changed_prob:
-                changed_prob = update_guess_from_child_state_prob_success(g, s, old_prob, s.prob_success)
+                changed_prob = update_guess_from_child_state_prob_success(g, s, old_wins, s.wins)
             changed_avg_num_guesses = False
             if compute_num_guesses:
-                changed_avg_num_guesses = update_guess_from_child_state_average_remaining_guesses(g, s, old_avg, s.average_remaining_guesses)
+                changed_avg_num_guesses = update_guess_from_child_state_average_remaining_guesses(g, s, old_total, s.total_guesses)
             if changed_prob or changed_avg_num_guesses:
                 parent_state = g.prev_state
                 if parent_state is not None:
@@ -1491,40 +3232,227 @@ def propagate_guess_to_state(s: State, alt_guess: Guess, skip_prob: bool = False
 
 def update_state_avg_num_guesses(s: State, alt_guess: Guess):
     '''
-    Update the parent state's average_remaining_guesses based on an update to that of one of the alternative next guesses.
-    A state's average_remaining_guesses is the max of those of its alternative guesses in that state.
+    Update the parent state's total_guesses based on an update to that of one of the alternative next guesses.
+    A state's average number of guesses is the min of those of its alternative guesses in that state (plus one for the
+    guess).  The totals are for the State's own wins, so the optimistic average of the best guess is rescaled to them.
+    A pessimistic average over fewer wins says nothing about the wins that the guess might add, which could take more
+    guesses, so the pessimistic total only comes from guesses certain to reach the most wins that the State could
+    have, and otherwise it is kept.
     :param s:
     :param alt_guess:
     :return:
     '''
     if not compute_num_guesses:
         return False
-    old_avg = s.average_remaining_guesses
+    old_total = s.total_guesses
     heapq.heapify(s.alternative_next_guesses)  # TODO -- this could be more efficient since only alt_guess changed; just do rotations on own here instead of relying on heapq
-    # example: if alternative probs are [(0.0, 1.0), (0.1, 0.2)] then the parent is (0.1, 1.0)
-    all_alts = not (len(s.alternative_next_guesses) < s.get_num_remaining_candidates())
-    # If prob_success has already converged, then we need to determine which guesses could be tied for that probability
+    all_alts = not (len(s.alternative_next_guesses) < s.get_num_guess_options())
+    # If the wins have already converged, then we need to determine which guesses could be tied for them
     if not optimize_for_winning:
         gs = s.alternative_next_guesses
-    elif all_alts and s.prob_success[1] - s.prob_success[0] < 1e-12:
-        gs = [g for g in s.alternative_next_guesses if g.prob_success[1] - s.prob_success[1] >= -1e-12]
+    elif all_alts and s.wins[0] == s.wins[1]:
+        gs = [g for g in s.alternative_next_guesses if g.wins[1] >= s.wins[1]]
     else:
         # eliminate guesses that we know cannot be the policy choice
-        gs = [g for g in s.alternative_next_guesses if g.prob_success[1] - s.prob_success[0] >= -1e-12]
-    pess_avg = min(ang.average_remaining_guesses[1] for ang in gs)
+        gs = [g for g in s.alternative_next_guesses if g.wins[1] >= s.wins[0]]
+    if not gs:
+        # The bounds of the State are tighter than those of the guesses added so far, so they say nothing new.
+        return False
+    # add one for each win for it being the state of the previous guess
+    pess_total = s.total_guesses[1]
+    certain = [g for g in gs if g.wins[0] >= s.wins[1]]  # then their wins and those of the State are the same
+    if certain:
+        pess_total = min(g.total_guesses[1] + g.wins[0] for g in certain)
     if not all_alts:
-        opt_avg = 0.0
+        opt_total = s.wins[1]
     else:
-        opt_avg = min(ang.average_remaining_guesses[0] for ang in gs)
-    s.average_remaining_guesses = (opt_avg + 1, pess_avg + 1)  # add one for it being the state of the previous guess
+        opt = gs[0]
+        for ang in gs:
+            if cmp_fractions(ang.total_guesses[0], ang.wins[1], opt.total_guesses[0], opt.wins[1]) < 0:
+                opt = ang
+        opt_total = rescale_total(opt.total_guesses[0] + opt.wins[1], opt.wins[1], s.wins[1], False)
+    s.total_guesses = (opt_total, pess_total)
     if debug:
-        print( "updated avg num guesses from " + str( old_avg ) + " to " + str( s.average_remaining_guesses ) + " for State: " + str(
+        print( "updated total guesses from " + str( old_total ) + " to " + str( s.total_guesses ) + " for State: " + str(
             s ) + " with " + str(s.get_num_remaining_candidates()) + " remaining candidates")
-    if cmp(old_avg, s.average_remaining_guesses) == 0:
+    if old_total == s.total_guesses:
         return False
     return True
 
 
+def candidate_indices(candidates: int):
+    """
+    Generate the indices of the words in the candidate set bloom filter in increasing order.  Unlike
+    nth_candidate(), this only visits the binary 1s instead of every bit position.
+    """
+    while candidates:
+        low_bit = candidates & -candidates
+        yield low_bit.bit_length() - 1
+        candidates ^= low_bit
+
+partition_cache = OrderedDict()  # (remaining candidates, guess word) -> [(child remaining candidates, count)]; least recently used first
+partition_cache_max_size = 20000  # the number of partitions to keep in partition_cache; the child sets take a lot of memory
+partition_hits = 0
+partition_misses = 0
+
+def compute_partition(cands: int, word: int):
+    """
+    Split the candidate set by the feedback for a guess.
+    :param cands: the bloom filter of the remaining candidates before the guess
+    :param word: the index of the guessed word
+    :return: a list of (child remaining candidates, number of candidates leading to the child) in the order of the
+    candidates, where the child for a win is 0
+    """
+    if cands > all_solution_candidates or word >= len(wordle_solutions):
+        return compute_partition_by_codes(cands, word)
+    counts = {}
+    for candidate in candidate_indices(cands):
+        if candidate == word:
+            child_remaining_candidates = 0
+        else:
+            child_remaining_candidates = cands & remaining_candidates[candidate][word]
+        counts[child_remaining_candidates] = counts.get(child_remaining_candidates, 0) + 1
+    return list(counts.items())
+
+def compute_partition_by_codes(cands: int, word: int):
+    """
+    compute_partition() for guessing a herring or for candidates that include herrings, grouping the solutions by
+    feedback_codes.  A herring stays a candidate (an allowed guess in hard mode) in the child with the feedback that
+    it would get if it were the solution.  Herrings that match no remaining solution are dropped with their feedback
+    since no solution leads there, and so are the useless ones from rank_herrings().
+    """
+    codes = feedback_codes[word]
+    sets = {}  # feedback code -> [child remaining candidates, number of solutions]
+    for candidate in candidate_indices(cands & all_solution_candidates):
+        code = codes[candidate]
+        e = sets.get(code)
+        if e is None:
+            sets[code] = [1 << candidate, 1]
+        else:
+            e[0] |= 1 << candidate
+            e[1] += 1
+    useful_herrings = rank_herrings(cands)[1]
+    if useful_herrings:
+        guess = guess_candidates[word]
+        for (code, e) in sets.items():
+            e[0] |= useful_herrings & feedback_mask(guess, code)
+    return [(0 if code == 242 else child, count) for (code, (child, count)) in sets.items()]  # only the guess is all green
+
+def next_candidates(cands: int, word: int, solution: int):
+    """ The remaining candidates after guessing the word when the solution is the one with the given index """
+    if cands <= all_solution_candidates and word < len(wordle_solutions):
+        return cands & remaining_candidates[solution][word]
+    for (child, count) in partition(cands, word):
+        if (child >> solution) & 1:
+            return child
+    return 1 << solution  # the win
+
+def guess_indices(cands: int):
+    """
+    The word indices that may be guessed: the remaining solution candidates and then herring_guess_options(), or
+    easy_guess_options() in easy mode
+    """
+    if not hard_mode:
+        return easy_guess_options(cands)
+    if cands <= all_solution_candidates:
+        return candidate_indices(cands)
+    return list(candidate_indices(cands & all_solution_candidates)) + herring_guess_options(cands)
+
+easy_options_cache = {}  # remaining candidates -> easy_guess_options()
+easy_options_cache_max_size = 100000  # easy_options_cache is cleared when it gets bigger than this
+
+def easy_guess_options(cands: int):
+    """
+    The guesses worth trying for the remaining candidates in easy mode, where any of the thousands of solutions (and
+    herrings if use_herrings) can be guessed.  A guess that doesn't split the candidates is useless unless it could win.  Guesses that split them into
+    the same sets (both winning or both not) are equivalent, so only the first is kept.  The remaining candidates
+    come first.  With two candidates, guessing one of them can't be beat.
+    :return: a list of word indices
+    """
+    options = easy_options_cache.get(cands)
+    if options is not None:
+        return options
+    options = list(candidate_indices(cands))
+    if len(options) > 2:
+        seen = {frozenset(child for (child, count) in compute_partition(cands, word)) for word in options}
+        for word in range(len(guess_candidates)):
+            if (cands >> word) & 1:
+                continue
+            p = compute_partition(cands, word)
+            if len(p) == 1:
+                continue  # it doesn't split the candidates
+            sets = frozenset(child for (child, count) in p)
+            if sets not in seen:
+                seen.add(sets)
+                options.append(word)
+    if len(easy_options_cache) >= easy_options_cache_max_size:
+        easy_options_cache.clear()
+    easy_options_cache[cands] = options
+    return options
+
+herring_options_cache = {}  # remaining candidates -> rank_herrings()
+herring_options_cache_max_size = 100000  # herring_options_cache is cleared when it gets bigger than this
+
+def herring_guess_options(cands: int):
+    """
+    The heuristic pre-filter of herring guesses, keeping the 5.6x wider branching tractable: of the herrings
+    consistent with the feedback so far, the max_herring_guesses that split the remaining solutions into the most
+    sets.  Policies are optimal over the solutions and these herrings.
+    :return: a list of herring word indices, best first
+    """
+    if max_herring_guesses <= 0:
+        return []
+    return rank_herrings(cands)[0]
+
+def rank_herrings(cands: int):
+    """
+    Rank the herrings among the candidates by the number of sets they split the remaining solutions into.  Herrings
+    that don't split the solutions at all are useless here, and since they don't split any subset either, they are
+    useless in every State after this one and are left out of its partitions.
+    :return: (herring_guess_options(), bloom filter of the useful herrings)
+    """
+    herrings = cands & ~all_solution_candidates
+    if not herrings:
+        return [], 0
+    r = herring_options_cache.get(cands)
+    if r is not None:
+        return r
+    solutions = list(candidate_indices(cands & all_solution_candidates))
+    scored = []
+    useful = 0
+    for herring in candidate_indices(herrings):
+        codes = feedback_codes[herring]
+        num_sets = len({codes[candidate] for candidate in solutions})
+        if num_sets > 1:
+            scored.append((-num_sets, herring))
+            useful |= 1 << herring
+    r = ([herring for (_, herring) in heapq.nsmallest(max_herring_guesses, scored)], useful)
+    if len(herring_options_cache) >= herring_options_cache_max_size:
+        herring_options_cache.clear()
+    herring_options_cache[cands] = r
+    return r
+
+def partition(cands: int, word: int):
+    """
+    Return compute_partition(cands, word), memoized in partition_cache with least-recently-used eviction so that
+    reaching the same candidates again (at another depth or after eviction from state_cache) skips the
+    per-candidate set intersections.
+    """
+    global partition_hits
+    global partition_misses
+    key = (cands, word)
+    p = partition_cache.get(key)
+    if p is not None:
+        partition_hits += 1
+        partition_cache.move_to_end(key)
+        return p
+    partition_misses += 1
+    p = compute_partition(cands, word)
+    partition_cache[key] = p
+    if len(partition_cache) > partition_cache_max_size:
+        partition_cache.popitem(last=False)
+    return p
+
 def nth_candidate(n: int, candidates: int, pos=0, ones=0):
     """
     Return the index of the nth word in the candidate set bloom filter
@@ -1550,6 +3478,10 @@ def nth_candidate(n: int, candidates: int, pos=0, ones=0):
         if mask > candidates:
             return -1
 
+def num_solutions(cands: int) -> int:
+    """ The number of remaining candidates that could be the solution, not counting herrings """
+    return num_ones_in_bits(cands & all_solution_candidates)
+
 def num_ones_in_bits(i: int) -> int:
     """
     Return the number of binary ones are in the int.  This is the number of items in the set for the bloom filter.
@@ -1559,6 +3491,23 @@ def num_ones_in_bits(i: int) -> int:
 
 _play_stats = {}
 
+def policy_guess(s: State):
+    """
+    The Guess that the policy makes in the State: the one with the most wins and then the fewest guesses on average,
+    with ties going to the first of alternative_next_guesses.
+    """
+    gs = list(s.alternative_next_guesses)
+    if optimize_for_winning:
+        m = max([gg.wins for gg in s.alternative_next_guesses])
+        gs = list(filter(lambda gg: cmp(gg.wins, m) == 0, s.alternative_next_guesses))
+    if minimize_guesses:
+        m = min(gs, key=cmp_to_key(cmp_avg))
+        gs = list( filter( lambda gg: cmp_avg(gg, m) == 0, gs ) )
+    if not optimize_for_winning and not minimize_guesses:
+        m = min([gg.average_num_remaining_candidates() for gg in s.alternative_next_guesses])
+        gs = list(filter(lambda gg: cmp(gg.prob_success, m) == 0, s.alternative_next_guesses))
+    return gs[0]
+
 def play(solution, quiet=False, first_guess=None):
     """
     Play wordle for the provided solution based on the policy that has been computed.
@@ -1574,21 +3523,26 @@ def play(solution, quiet=False, first_guess=None):
     count = 0
     states = [init_state]
     while True:
+        materialize(s)
         # If no more guesses for states, pick random among remaining candidates
         if not s and child_candidates:
-            csi = random.randint(1, num_ones_in_bits(child_candidates))
-            guess = nth_candidate(csi, child_candidates)
+            num_child_candidates = num_solutions(child_candidates)
+            if 1 < num_child_candidates <= endgame_max_candidates and guesses_left(count, num_child_candidates) > 1:
+                guess = solve_endgame(child_candidates, guesses_left(count, num_child_candidates))[2]
+            else:
+                csi = random.randint(1, num_child_candidates)
+                guess = nth_candidate(csi, child_candidates)
             if not quiet:
-                print(wordle_solutions[guess])
+                print(guess_candidates[guess])
             count += 1
             if guess == si:
                 if not quiet:
-                    print("win in choice among " + str(num_ones_in_bits(child_candidates)) + " alternatives")
+                    print("win in choice among " + str(num_solutions(child_candidates)) + " alternatives")
                 break
             if guess < 0:
                 print("error 1")
                 break
-            child_candidates = child_candidates & remaining_candidates[si][guess]
+            child_candidates = next_candidates(child_candidates, guess, si)
             continue
         if not s or not s.alternative_next_guesses:
             if s:
@@ -1599,19 +3553,8 @@ def play(solution, quiet=False, first_guess=None):
             break
 
         # Get the next guess
-        gs = list(s.alternative_next_guesses)
-        if optimize_for_winning:
-            m = max([gg.prob_success for gg in s.alternative_next_guesses])
-            gs = list(filter(lambda gg: cmp(gg.prob_success, m) == 0, s.alternative_next_guesses))
-        if minimize_guesses:
-            m = min([gg.average_remaining_guesses for gg in gs])
-            gs = list( filter( lambda gg: cmp(gg.average_remaining_guesses, m) == 0, gs ) )
-        if not optimize_for_winning and not minimize_guesses:
-            m = min([gg.average_num_remaining_candidates() for gg in s.alternative_next_guesses])
-            gs = list(filter(lambda gg: cmp(gg.prob_success, m) == 0, s.alternative_next_guesses))
-
-        g = gs[0]
-        w = wordle_solutions[g.word]
+        g = policy_guess(s)
+        w = guess_candidates[g.word]
         if not quiet:
             print(w)
         count += 1
@@ -1619,7 +3562,7 @@ def play(solution, quiet=False, first_guess=None):
             if not quiet:
                 print("win in choice among " + str(s.get_num_remaining_candidates()) + " alternatives")
             break
-        child_candidates = s.remaining_candidates & remaining_candidates[si][g.word]
+        child_candidates = next_candidates(s.remaining_candidates, g.word, si)
         ss = list(filter(lambda cs: (cs.remaining_candidates == child_candidates), g.next_states.keys()))
         s = ss[0] if ss else None
         states.append(s)
@@ -1631,12 +3574,610 @@ def play(solution, quiet=False, first_guess=None):
                 _play_stats[sss] = [count]
     return count
 
+num_feedback_codes = 243  # 3 ** 5; every feedback_code() is less than this
+compiled_policy_magic = b'WRDLPOL2'  # the start of a file written by write_compiled_policy()
+compiled_policy_header = ['mode', 'num_words', 'num_solutions', 'num_nodes', 'num_tables', 'child_size']
+compiled_policy = None  # the CompiledPolicy last read by read_compiled_policy()
+
+def compiled_policy_filename():
+    return cache_path("compiled_policy" + ("" if hard_mode else "_easy") + ".bin", *guess_word_lists())
+
+def policy_move(state: State, num_prior_guesses: int, cands: int, word: int = None):
+    """
+    The guess that play() makes after the number of prior guesses with the remaining candidates.  For a State with
+    guesses, it is the one from policy_guess().  Where the policy has no State, as after the guess of a State
+    converged by set_exact_policy(), it comes from solve_endgame() for a few candidates, and otherwise it is the
+    first solution candidate, where play() picks one randomly.
+    :param state: the State of the policy, or None
+    :param word: the index of the guess to make instead of the policy's
+    :return: (index of the guessed word, {remaining candidates after the guess: child State})
+    """
+    materialize(state)
+    if state is not None and state.alternative_next_guesses:
+        if word is None:
+            gs = [policy_guess(state)]
+        else:
+            gs = [g for g in state.alternative_next_guesses if g.word == word]
+        if gs:
+            return gs[0].word, {cs.remaining_candidates: cs for cs in gs[0].next_states}
+    if word is None:
+        n = num_solutions(cands)
+        if 1 < n <= endgame_max_candidates and guesses_left(num_prior_guesses, n) > 1:
+            word = solve_endgame(cands, guesses_left(num_prior_guesses, n))[2]
+        else:
+            word = next(candidate_indices(cands & all_solution_candidates))
+    return word, {}
+
+def evaluate_policy(first_guess=None, s: State = None):
+    """
+    Play every solution with the policy, like [play(w, quiet=True) for w in wordle_solutions], in one walk of the
+    policy.  The solutions that reach a State are routed together down its guess from policy_move(), split by
+    partition(), so each State is visited once for all of them instead of once per solution from the root.
+    :param first_guess: a word or index to guess first instead of the policy's guess
+    :param s: the State to start from, init_state by default
+    :return: (histogram, losses, state_stats) where the histogram maps a number of guesses to the number of
+    solutions won with that many, losses are the solutions that took more than six guesses, and state_stats maps
+    (number of prior guesses, remaining candidates) of each State on the way to the histogram of the solutions
+    that passed through it
+    """
+    if s is None:
+        s = init_state
+    if type(first_guess) == str:
+        first_guess = word_indices[first_guess]
+    histogram = {}
+    losses = []
+    state_stats = {}
+    stack = [(s, s.num_prior_guesses, s.remaining_candidates, first_guess, [])]
+    while stack:
+        (state, num_prior_guesses, cands, word, path) = stack.pop()
+        path = path + [state_stats.setdefault((num_prior_guesses, cands), {})]
+        (word, children) = policy_move(state, num_prior_guesses, cands, word)
+        count = num_prior_guesses + 1
+        for (child, n) in partition(cands, word):
+            if child != 0:
+                stack.append((children.get(child), count, child, None, path))
+        if (cands & all_solution_candidates) >> word & 1:
+            histogram[count] = histogram.get(count, 0) + 1
+            for stats in path:
+                stats[count] = stats.get(count, 0) + 1
+            if count > 6:
+                losses.append(guess_candidates[word])
+    return dict(sorted(histogram.items())), sorted(losses), state_stats
+
+def _evaluate_opener_worker(word: int):
+    """ Evaluate a first guess in a worker process for evaluate_openers() """
+    (histogram, losses, _) = evaluate_policy(word)
+    return word, histogram, losses
+
+def evaluate_openers(words: list = None, processes: int = None):
+    """
+    Evaluate the policy after each of several first guesses with evaluate_policy().  The worker processes get the
+    policy from this one when they are forked.
+    :param words: the first guesses (strings or indices), those of init_state that have converged by default
+    :param processes: the number of worker processes; None for one per CPU, or 1 to run in this process
+    :return: a dictionary, first guess word -> (histogram, losses)
+    """
+    materialize(init_state)
+    if words is None:
+        words = [g.word for g in init_state.alternative_next_guesses if converged(g)]
+    words = [word_indices[w] if type(w) == str else w for w in words]
+    tl = process_time()
+    if processes == 1:
+        results = [_evaluate_opener_worker(w) for w in words]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_evaluate_opener_worker, words)
+    print("seconds elapsed for evaluating " + str(len(words)) + " first guesses = " + str(process_time() - tl) +
+          " (only counting this process)")
+    return {guess_candidates[word]: (histogram, losses) for (word, histogram, losses) in results}
+
+def compile_policy(s: State = None):
+    """
+    Extract the decision tree that play() follows from a State (init_state by default), leaving out the other
+    guesses and the bounds.  Each node of the tree is a State of the policy (or a set of candidates where it has
+    none) with its guess from policy_move(), and the node that the feedback for the guess leads to is looked up by
+    feedback code in a table of num_feedback_codes entries.  Nodes are shared by the paths that lead to the same
+    State.
+    :return: (node words, node tables, tables) as arrays, where node i guesses the word node_words[i] and
+    tables[num_feedback_codes * node_tables[i] + code] is one more than the node for the feedback code, or 0 if no
+    remaining candidate gets it.  The root is node 0, and table 0 is the empty one of nodes with a single candidate.
+    """
+    if s is None:
+        s = init_state
+    node_indices = {}  # id(State), or (guesses left, remaining candidates) with no State -> node index
+    nodes = []  # (State or None, number of prior guesses, remaining candidates)
+    node_words = array('I')
+    node_tables = array('I')
+    tables = array('I', bytes(4 * num_feedback_codes))
+
+    def node(state, num_prior_guesses, cands):
+        key = id(state) if state is not None else (guesses_left(num_prior_guesses, num_solutions(cands)), cands)
+        i = node_indices.get(key)
+        if i is None:
+            i = node_indices[key] = len(nodes)
+            nodes.append((state, num_prior_guesses, cands))
+        return i
+
+    node(s, s.num_prior_guesses, s.remaining_candidates)
+    for (state, num_prior_guesses, cands) in nodes:  # nodes grows as children are found
+        (word, children) = policy_move(state, num_prior_guesses, cands)
+        guess = guess_candidates[word]
+        table = 0
+        for solution in candidate_indices(cands & all_solution_candidates):
+            if solution == word:
+                continue
+            if table == 0:
+                table = len(tables) // num_feedback_codes
+                tables.extend(tables[:num_feedback_codes])
+            i = table * num_feedback_codes + feedback_code(guess, guess_candidates[solution])
+            if tables[i] == 0:
+                child_cands = next_candidates(cands, word, solution)
+                tables[i] = 1 + node(children.get(child_cands), num_prior_guesses + 1, child_cands)
+        node_words.append(word)
+        node_tables.append(table)
+    return node_words, node_tables, tables
+
+def write_compiled_policy(filename: str = None, s: State = None):
+    """
+    Write the tree from compile_policy() to a file that CompiledPolicy memory-maps: compiled_policy_magic, the
+    word_list_key(), the fields of compiled_policy_header as 8-byte integers, the guess candidates as 5 ascii bytes
+    each, and then the node words, node tables and tables as little-endian integers, each padded to a multiple of 8
+    bytes.  The child entries of the tables are 2 bytes when there are few enough nodes.
+    :return: the number of nodes
+    """
+    if filename is None:
+        filename = compiled_policy_filename()
+    (node_words, node_tables, tables) = compile_policy(s)
+    if len(node_words) < 1 << 16:
+        tables = array('H', tables)
+    header = array('q', [checkpoint_mode(), len(guess_candidates), len(wordle_solutions), len(node_words),
+                         len(tables) // num_feedback_codes, tables.itemsize])
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(compiled_policy_magic + word_list_key(*guess_word_lists()).encode())
+        for data in [little_endian(header), ''.join(guess_candidates).encode(), little_endian(node_words),
+                     little_endian(node_tables), little_endian(tables)]:
+            f.write(data + bytes(-len(data) % 8))
+    os.replace(tmp, filename)
+    return len(node_words)
+
+class CompiledPolicy:
+    """
+    A policy written by write_compiled_policy().  The file is memory-mapped, so it is ready as soon as it is
+    opened, and each move is a lookup in its tables.  It doesn't need init_globals() or the remaining_candidates
+    matrix since it has its own copy of the guess candidates.  A node is an int, starting with the root, 0.
+    """
+
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        m = memoryview(self.mmap)
+        if m[:len(compiled_policy_magic)] != compiled_policy_magic:
+            raise Exception(filename + ' is not a compiled policy')
+        pos = len(compiled_policy_magic)
+        self.key = bytes(m[pos:pos + 16]).decode()
+        pos += 16
+
+        def section(size, typecode):
+            nonlocal pos
+            data = m[pos:pos + size]
+            pos += size + (-size % 8)
+            if typecode is None:
+                return data
+            if sys.byteorder != 'little':
+                a = array(typecode, data)
+                a.byteswap()
+                return a
+            return data.cast(typecode)
+
+        self.header = dict(zip(compiled_policy_header, section(8 * len(compiled_policy_header), 'q')))
+        num_words = self.header['num_words']
+        num_nodes = self.header['num_nodes']
+        words = bytes(section(5 * num_words, None)).decode()
+        self.words = [words[i:i + 5] for i in range(0, 5 * num_words, 5)]
+        self.solutions = self.words[:self.header['num_solutions']]
+        self.word_indices = {w: i for (i, w) in enumerate(self.words)}
+        self.node_words = section(4 * num_nodes, 'I')
+        self.node_tables = section(4 * num_nodes, 'I')
+        self.tables = section(self.header['child_size'] * num_feedback_codes * self.header['num_tables'],
+                              'H' if self.header['child_size'] == 2 else 'I')
+
+    def guess(self, node: int) -> str:
+        """ The word that the policy guesses at the node """
+        return self.words[self.node_words[node]]
+
+    def next_node(self, node: int, code: int) -> int:
+        """ The node after the guess at the node gets the feedback code, or -1 if no solution gets that feedback """
+        return self.tables[self.node_tables[node] * num_feedback_codes + code] - 1
+
+    def play(self, solution: str, quiet: bool = False):
+        """
+        Play wordle for the solution like play() does.
+        :return: how many guesses were made
+        """
+        node = 0
+        count = 0
+        while True:
+            guess = self.guess(node)
+            if not quiet:
+                print(guess)
+            count += 1
+            if guess == solution:
+                if not quiet:
+                    print("win")
+                return count
+            node = self.next_node(node, feedback_code(guess, solution))
+            if node < 0:
+                raise Exception(solution + ' is not a solution of the compiled policy')
+
+    def next_guess(self, feedback: list):
+        """
+        Like next_guess(), but the guesses must be the policy's, and the remaining solutions aren't kept.
+        :param feedback: a list of (guessed word, feedback pattern for parse_feedback())
+        :return: the word to guess next, or None if the last feedback was all green
+        """
+        node = 0
+        for (guess, pattern) in feedback:
+            code = parse_feedback(pattern)
+            if code == 242:
+                return None
+            if guess != self.guess(node):
+                raise Exception(guess + ' is not the guess of the compiled policy')
+            node = self.next_node(node, code)
+            if node < 0:
+                raise Exception('no solution is consistent with the feedback')
+        return self.guess(node)
+
+def read_compiled_policy(filename: str = None):
+    """ Load the CompiledPolicy from the file (by default, the one for the word lists) into compiled_policy """
+    global compiled_policy
+    compiled_policy = CompiledPolicy(compiled_policy_filename() if filename is None else filename)
+    return compiled_policy
+
+feedback_letters = {'g': 2, 'y': 1, 'b': 0, '2': 2, '1': 1, '0': 0, '-': 0, '.': 0}  # feedback pattern letter -> digit
+
+def parse_feedback(pattern) -> int:
+    """
+    The feedback code, as from feedback_code(), for a pattern of five letters like 'BYBGG' with G for green, Y for
+    yellow and B for gray.  The digits 2, 1 and 0 are also accepted, and a code is returned as it is.
+    """
+    if type(pattern) == int:
+        return pattern
+    if len(pattern) != 5 or any(c not in feedback_letters for c in pattern.lower()):
+        raise Exception('feedback ' + repr(pattern) + ' is not five of G, Y and B')
+    code = 0
+    for c in pattern.lower():
+        code = code * 3 + feedback_letters[c]
+    return code
+
+def feedback_index(s: State):
+    """
+    The index of a State for next_guess(): (index of the word of policy_guess(), or None if the State has no guesses,
+    {guess word index: Guess, or {feedback code: child State} once feedback_child() has looked it up}).  It is built
+    the first time that the State is queried and kept with it, so it is for a policy that is done changing.
+    """
+    if s.feedback_index is None:
+        materialize(s)
+        word = policy_guess(s).word if s.alternative_next_guesses else None
+        s.feedback_index = (word, {g.word: g for g in s.alternative_next_guesses})
+    return s.feedback_index
+
+def feedback_child(s: State, word: int, code: int):
+    """ The child State that the feedback code for the guess leads to, or None if the policy has none """
+    guesses = feedback_index(s)[1]
+    children = guesses.get(word)
+    if type(children) is Guess:
+        guess = guess_candidates[word]
+        children = {}
+        for cs in guesses[word].next_states:
+            if cs.remaining_candidates != 0:  # not the win
+                solution = next(candidate_indices(cs.remaining_candidates & all_solution_candidates))
+                children[feedback_code(guess, guess_candidates[solution])] = cs
+        guesses[word] = children
+    return children.get(code) if children is not None else None
+
+def next_guess(feedback: list, s: State = None):
+    """
+    The policy's next guess in a real game, where the solution isn't known, from the feedback so far.  Each guess
+    and feedback code is followed to the child State with feedback_child().  After a guess that the policy doesn't
+    have, or after the last State of the policy, the candidates are narrowed with feedback_mask(), and the guess
+    comes from policy_move().
+    :param feedback: a list of (guessed word, feedback pattern for parse_feedback())
+    :param s: the State before the first guess, init_state by default
+    :return: (the word to guess next, or None if the last feedback was all green, the list of remaining solutions)
+    """
+    if s is None:
+        s = init_state
+    materialize(s)
+    if s is None or not s.alternative_next_guesses:
+        raise Exception('there is no policy to play; run the search or load_policy() first')
+    num_prior_guesses = s.num_prior_guesses
+    cands = s.remaining_candidates
+    for (guess, pattern) in feedback:
+        code = parse_feedback(pattern)
+        if code == 242:
+            return None, [guess]
+        word = word_indices.get(guess)
+        s = feedback_child(s, word, code) if s is not None and word is not None else None
+        cands = s.remaining_candidates if s is not None else cands & feedback_mask(guess, code)
+        num_prior_guesses += 1
+    solutions = cands & all_solution_candidates
+    if solutions == 0:
+        raise Exception('no solution is consistent with the feedback')
+    word = feedback_index(s)[0] if s is not None else None
+    if word is None:
+        word = policy_move(None, num_prior_guesses, cands)[0]
+    return guess_candidates[word], [guess_candidates[i] for i in candidate_indices(solutions)]
+
+def load_policy(lazy: bool = True):
+    """
+    Initialize the globals and load the policy from the newest checkpoint of the word lists for playing it, with
+    the guesses of each State built when they are first needed.
+    :return: whether a checkpoint with a policy for init_state was loaded
+    """
+    global init_state
+    init_globals()
+    init_state = State()
+    init_state.remaining_candidates = all_guess_candidates if hard_mode else all_solution_candidates
+    init_state.wins = (0, len(wordle_solutions))
+    init_state = get_or_cache_state(init_state)
+    read_endgame_table(endgame_table_filename())
+    if not resume_from_checkpoint(lazy=lazy):
+        return False
+    materialize(init_state)
+    return bool(init_state.alternative_next_guesses)
+
+def answer_json_line(line: str) -> dict:
+    """
+    Answer a request of serve_json_lines(): {"feedback": [[guessed word, feedback pattern], ...]}, or just the list
+    :return: {"guess": next guess or null, "candidates": [remaining solutions]}, or {"error": message}
+    """
+    try:
+        request = json.loads(line)
+        (guess, candidates) = next_guess(request['feedback'] if type(request) == dict else request)
+        return {'guess': guess, 'candidates': candidates}
+    except Exception as e:
+        return {'error': str(e)}
+
+def serve_json_lines(inp=None, out=None):
+    """
+    Answer a request from answer_json_line() for each line of the input, writing the answers as lines of JSON
+    as they come.  Run with "python wordler.py --json-lines" to play a real game with the policy, for example
+    with a request of {"feedback": [["trace", "BBYBG"]]}.
+    """
+    inp = inp or sys.stdin
+    out = out or sys.stdout
+    for line in inp:
+        if line.strip():
+            out.write(json.dumps(answer_json_line(line)) + '\n')
+            out.flush()
+
+serve_port = 8315  # the localhost port that serve() listens on
+serve_latency_window = 10000  # the number of recent requests of each path that the latency percentiles are over
+serving_policy = None  # the CompiledPolicy that serve() answers from, or None for the States of load_policy()
+serve_started = 0.0  # perf_counter() when serve() started
+serve_stats = {}  # request path -> [number of requests, number of errors, deque of recent latencies in seconds]
+serve_lock = threading.Lock()  # held by the request threads to look up States, which are built and indexed on first use, and to count
+_evaluations = {}  # first guess word or None -> evaluation answered by answer_evaluate(); the policy doesn't change
+
+def answer_next_guess(request: dict) -> dict:
+    """
+    Answer a /next-guess request of serve(): {"feedback": [[guessed word, feedback pattern], ...]}
+    :return: {"guess": next guess or null, "candidates": [remaining solutions]}, without the candidates when
+    serving a CompiledPolicy
+    """
+    if serving_policy is not None:
+        return {'guess': serving_policy.next_guess(request['feedback'])}
+    with serve_lock:
+        (guess, candidates) = next_guess(request['feedback'])
+    return {'guess': guess, 'candidates': candidates}
+
+def answer_evaluate(request: dict) -> dict:
+    """
+    Answer an /evaluate request of serve().  With a solution, {"solution": word}, the game for it is played, and
+    the answer is {"guesses": [guessed words]}.  Otherwise, the policy is evaluated for all solutions, or after
+    {"first_guess": word}, and the answer is {"histogram": {number of guesses: number of solutions}, "losses":
+    [solutions lost]}.  Evaluations are kept, so a repeated one is a lookup.
+    """
+    solution = request.get('solution')
+    if solution is not None:
+        guesses = []
+        while not guesses or guesses[-1] != solution:
+            if len(guesses) >= 20:
+                raise Exception(solution + ' is not won by the policy')
+            feedback = [(g, feedback_code(g, solution)) for g in guesses]
+            guesses.append(answer_next_guess({'feedback': feedback})['guess'])
+        return {'guesses': guesses}
+    first_guess = request.get('first_guess')
+    with serve_lock:
+        evaluation = _evaluations.get(first_guess)
+        if evaluation is None:
+            if serving_policy is not None:
+                if first_guess is not None:
+                    raise Exception('a compiled policy is only evaluated with its own first guess')
+                histogram = {}
+                losses = []
+                for w in serving_policy.solutions:
+                    count = serving_policy.play(w, quiet=True)
+                    histogram[count] = histogram.get(count, 0) + 1
+                    if count > 6:
+                        losses.append(w)
+                histogram = dict(sorted(histogram.items()))
+            else:
+                (histogram, losses, _) = evaluate_policy(first_guess)
+            evaluation = _evaluations[first_guess] = {'histogram': histogram, 'losses': losses}
+    return evaluation
+
+def serve_metrics() -> dict:
+    """
+    The counters of serve() for the /metrics request: the uptime in seconds and, for each request path, the number
+    of requests and errors, the requests per second since the start, and the p50 and p99 latencies in milliseconds
+    of the last serve_latency_window requests
+    """
+    uptime = time.perf_counter() - serve_started
+    metrics = {'uptime': uptime, 'paths': {}}
+    with serve_lock:
+        stats = [(path, count, errors, sorted(latencies)) for (path, (count, errors, latencies)) in serve_stats.items()]
+    for (path, count, errors, latencies) in stats:
+        metrics['paths'][path] = {'requests': count, 'errors': errors, 'throughput': count / uptime,
+                                  'p50_ms': 1000 * percentile(latencies, 0.5),
+                                  'p99_ms': 1000 * percentile(latencies, 0.99)}
+    return metrics
+
+def percentile(sorted_values: list, q: float):
+    """ The value at the fraction q of the way through the sorted list, or 0 if it is empty """
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))] if sorted_values else 0
+
+class PolicyRequestHandler(BaseHTTPRequestHandler):
+    """
+    The requests of serve(): a POST of a JSON object to /next-guess or /evaluate, or a GET of /metrics or /words
+    (the solutions, for load_test()).  The connections are kept alive between requests.
+    """
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True  # the headers and body are separate writes, which would wait for delayed acks
+    answers = {'/next-guess': answer_next_guess, '/evaluate': answer_evaluate}
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self.send_json(200, serve_metrics())
+        elif self.path == '/words':
+            self.send_json(200, {'solutions': serving_policy.solutions if serving_policy else wordle_solutions})
+        else:
+            self.send_json(404, {'error': 'no ' + self.path})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        answer = self.answers.get(self.path)
+        if answer is None:
+            self.send_json(404, {'error': 'no ' + self.path})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            (status, response) = (200, answer(request))
+        except Exception as e:
+            (status, response) = (400, {'error': str(e)})
+        self.send_json(status, response)
+        with serve_lock:
+            stats = serve_stats.setdefault(self.path, [0, 0, deque(maxlen=serve_latency_window)])
+            stats[0] += 1
+            stats[1] += status != 200
+            stats[2].append(time.perf_counter() - start)
+
+    def send_json(self, status: int, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # serve_stats counts the requests instead
+
+def serve(port: int = None, compiled: bool = False, block: bool = True):
+    """
+    Answer the requests of PolicyRequestHandler on localhost with a thread for each connection, after loading the
+    policy once: the newest checkpoint with load_policy(), or the file of write_compiled_policy(), which starts in
+    milliseconds and doesn't need the matrix but only answers for the policy's own guesses.  Run with
+    "python wordler.py --serve" (or "--serve --compiled") and try it with load_test().
+    :param block: whether to serve until interrupted, or in a background thread
+    :return: the server, which is shut down with shutdown(), if not blocking
+    """
+    global serving_policy
+    global serve_started
+    global serve_stats
+    global _evaluations
+    port = port or serve_port
+    if compiled:
+        serving_policy = read_compiled_policy()
+    else:
+        serving_policy = None
+        if not load_policy():
+            raise Exception('no checkpoint of a policy for the word lists; run the search first')
+    serve_stats = {}
+    _evaluations = {}
+    server = ThreadingHTTPServer(('127.0.0.1', port), PolicyRequestHandler)
+    serve_started = time.perf_counter()
+    print("serving the " + ("compiled " if compiled else "") + "policy on http://127.0.0.1:" + str(port))
+    if not block:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+def load_test(num_requests: int = 10000, concurrency: int = 8, port: int = None, evaluate_every: int = 100):
+    """
+    Generate traffic for serve() from threads that each keep a connection open: games of random solutions played
+    one /next-guess request per guess, and an /evaluate of a solution every evaluate_every requests.  Prints the
+    latency percentiles and throughput seen by the clients and then the server's /metrics.
+    :return: the number of requests that failed
+    """
+    port = port or serve_port
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', '/words')
+    solutions = json.loads(connection.getresponse().read())['solutions']
+    connection.close()
+    results = []  # (latencies, number of failures) of each client
+    counts = [num_requests // concurrency + (i < num_requests % concurrency) for i in range(concurrency)]
+
+    def client(n, seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        latencies = []
+        failures = 0
+        feedback = []
+        solution = rng.choice(solutions)
+        for i in range(n):
+            if i % evaluate_every == evaluate_every - 1:
+                (path, request) = ('/evaluate', {'solution': rng.choice(solutions)})
+            else:
+                (path, request) = ('/next-guess', {'feedback': feedback})
+            start = time.perf_counter()
+            conn.request('POST', path, json.dumps(request), {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            answer = json.loads(response.read())
+            latencies.append(time.perf_counter() - start)
+            if response.status != 200:
+                failures += 1
+                feedback = []
+            elif path == '/next-guess':
+                guess = answer['guess']
+                if guess is None or guess == solution or len(feedback) >= 10:
+                    feedback = []  # start a new game
+                    solution = rng.choice(solutions)
+                else:
+                    feedback = feedback + [(guess, feedback_code(guess, solution))]
+        conn.close()
+        results.append((latencies, failures))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(n, i)) for (i, n) in enumerate(counts)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies = sorted(x for (client_latencies, _) in results for x in client_latencies)
+    failures = sum(f for (_, f) in results)
+    print(str(num_requests) + " requests from " + str(concurrency) + " clients in " + str(elapsed) + " seconds = " +
+          str(num_requests / elapsed) + " requests/second, p50 = " + str(1000 * percentile(latencies, 0.5)) +
+          " ms, p99 = " + str(1000 * percentile(latencies, 0.99)) + " ms, failures = " + str(failures))
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', '/metrics')
+    print("server metrics: " + connection.getresponse().read().decode())
+    connection.close()
+    return failures
+
 def tree_size(s: State):
     """
     Walks the tree for all guesses for all games and counts the states it visits.  This would be an accurate
     count of the states in memory if the cache were turned off (cache_on = False).  So, when compared with cache_size(),
     tree_size() gives an idea of how effective the cache is.
     """
+    materialize(s)
     if s is None or not s.alternative_next_guesses:
         return 0
     ct = len(s.alternative_next_guesses)
@@ -1657,6 +4198,7 @@ def guess_tree( num_guesses: int, remaining_cands: int, word ):
         print("Error: No state for num_guesses = " + str(num_guesses) + " and remaining_candidates = " +
               str( remaining_cands ) )
         return ""
+    materialize(s)
     if type(word) == str:
         word = word_indices[word]
     gs = [g for g in s.alternative_next_guesses if g.word == word]
@@ -1667,7 +4209,8 @@ def guess_tree( num_guesses: int, remaining_cands: int, word ):
     return gt(gs[0])
 
 def stg(s):
-    gr = ("  guesses = " + ", ".join( [ "(" + str( g.word ) + ") " + wordle_solutions[ g.word ] +
+    materialize(s)
+    gr = ("  guesses = " + ", ".join( [ "(" + str( g.word ) + ") " + guess_candidates[ g.word ] +
                                        (" p=(%.4f,%.4f) ang=(%.4f,%.4f)" %
                                         (*g.prob_success, *g.average_remaining_guesses))
                                        for g in list( s.alternative_next_guesses )[ 0:10 ] ]) +
@@ -1681,7 +4224,7 @@ def st(s: State = init_state):
 
 def gt( g: Guess ):
     s: State = g.prev_state
-    r = (wordle_solutions[g.word] + " (" + str(g.word) + ") as guess # " + str(s.num_prior_guesses + 1) + ", " +
+    r = (guess_candidates[g.word] + " (" + str(g.word) + ") as guess # " + str(s.num_prior_guesses + 1) + ", " +
          str(s.get_num_remaining_candidates()) + " cands (" + str(s.remaining_candidates) + "): p=" +
          str(g.prob_success ) + ", ang=" + str( g.average_remaining_guesses ))
     return r + "\n" + gtn(g)
@@ -1787,11 +4330,219 @@ def test():
     #  - two guesses for 'egikm'
     #  - two guesses for 'dfhjl'
     #  - for ['abcd' + x for x in 'fghijklm']
-    #    - win with prob 5/8 in (2 + 3 + 4 + 5 + 6) / 5 guesses
-    #    - lose with prob 3/8
-    # Thus, the average number of guesses it (1 * 1/11 + 2 * 2/11 + 5.5 * 5/11) / (8/11) = (1 * 1 + 2 * 2 + 5.5 * 5) / 8 = 32.5/8 = 4.0625  # This may be wrong since the policy says 3.25
+    #    - win 5 of them in 2, 3, 4, 5, and 6 guesses
+    #    - lose the other 3
+    # Thus, the average number of guesses for the 8 wins is (1 * 1 + 2 * 2 + (2 + 3 + 4 + 5 + 6)) / 8 = 25/8 = 3.125
     run()
 
+def clear_tables():
+    """ Clear the search tables, which are indexed by word and so don't carry over to another word list. """
+    reset_state_cache()
+    endgame_table.clear()
+    partition_cache.clear()
+    rollout_table.clear()
+    minimax_table.clear()
+    herring_options_cache.clear()
+    easy_options_cache.clear()
+
+def benchmark_configurations(configurations: list, num_solutions: int = 100, num_herrings: int = None,
+                             trace_memory: bool = True):
+    """
+    Compare the search in different configurations on the first solutions: CPU seconds of the search after
+    init_globals(), search iterations per second, cached States, and the peak memory traced by tracemalloc.
+    :param configurations: a list of (label, {global variable name: value}); the globals are restored afterwards
+    :param num_solutions: the number of solutions to keep
+    :param num_herrings: the number of herrings to keep, all of them by default
+    :param trace_memory: whether to trace the peak memory, which slows the search down a few times
+    :return: {label: stats} where the stats are dictionaries
+    """
+    global wordle_solutions
+    global wordle_herrings
+    saved_words = (wordle_solutions, wordle_herrings)
+    wordle_solutions = saved_words[0][:num_solutions]
+    wordle_herrings = saved_words[1] if num_herrings is None else saved_words[1][:num_herrings]
+    results = {}
+    for (label, settings) in configurations:
+        settings = dict({'resume_runs': False}, **settings)  # each configuration is timed from scratch
+        saved = {name: globals()[name] for name in settings}
+        globals().update(settings)
+        clear_tables()
+        if trace_memory:
+            tracemalloc.start()
+        ct = _ct
+        run()
+        seconds = process_time() - tl_start  # since run_no_init() started
+        peak = 0
+        if trace_memory:
+            (_, peak) = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        results[label] = {'guesses': len(guess_candidates), 'cpu seconds': seconds,
+                          'iterations per second': (_ct - ct) / seconds, 'cached states': cache_size(),
+                          'peak MB': peak / 2 ** 20, 'prob success': init_state.prob_success,
+                          'avg guesses': init_state.average_remaining_guesses}
+        globals().update(saved)
+    (wordle_solutions, wordle_herrings) = saved_words
+    clear_tables()
+    for (label, stats) in results.items():
+        print(label + ": " + str(stats))
+    return results
+
+def benchmark_herrings(num_solutions: int = 100, num_herrings: int = None, trace_memory: bool = True):
+    """ Compare the search with and without herring guesses; see benchmark_configurations(). """
+    return benchmark_configurations([('solutions only', {'use_herrings': False}), ('herrings', {'use_herrings': True})],
+                                    num_solutions, num_herrings, trace_memory)
+
+def benchmark_easy_mode(num_solutions: int = 200, trace_memory: bool = True):
+    """
+    Compare the search in hard mode and easy mode on the first num_solutions words; see benchmark_configurations().
+    The default of 200 words takes about 10 CPU minutes, since easy mode isn't practical on 400 words yet.  Easy mode
+    takes about 20 times as long each time the number of words doubles.  On one CPU without tracing memory, hard mode
+    took 0.9 CPU seconds for 100 words, 8.6 for 200, and 80 for 400, while easy mode took 26 CPU seconds for 100 words
+    and 9.5 CPU minutes for 200.  At 400 words, easy mode had only converged 2 of the 400 first guesses after 24 CPU
+    minutes, so it would take hours.
+    """
+    return benchmark_configurations([('hard mode', {'hard_mode': True}), ('easy mode', {'hard_mode': False})],
+                                    num_solutions, trace_memory=trace_memory)
+
+def test_minimize_guesses():
+    """
+    Check the policies found when minimizing the average number of guesses against the totals worked out for the
+    synthetic word lists in the comments of test().  Without a limit of six guesses, every word is won, so 'abcde' now
+    wins all 11 words of the first list in (1 * 1 + 2 * 2 + (2 + 3 + ... + 9)) = 49 guesses.  For the second list
+    without 'dfhjl', 'egikm' still takes 1 + 2 * 5 + (2 + 3 + 4 + 5) = 25 guesses over 10 words, and 'abcde' splits
+    off 'egikm' for 1 + 2 + (2 + 3 + ... + 9) = 47.  With the limit (optimize_for_winning), 'dfhjl' and 'egikm' tie on
+    winning all 11 words of the first list, so only their averages tell them apart, and 'abcde' wins 8 in 25 guesses as
+    in test().  Without 'dfhjl', 'abcde' wins 1 + 1 + 5 in 1 + 2 + (2 + 3 + ... + 6) = 23 guesses.
+    Each case is run a second time without the endgame table and closed form, so that the bounds of the search find
+    the policies rather than exhaustive search of the small sets.
+    :return: whether all first guesses have the expected wins and total number of guesses
+    """
+    global wordle_solutions
+    global optimize_for_winning
+    global minimize_guesses
+    global endgame_max_candidates
+    global use_closed_form
+    global cache_dir
+    global resume_runs
+    saved = (wordle_solutions, optimize_for_winning, minimize_guesses, endgame_max_candidates, use_closed_form,
+             cache_dir, resume_runs)
+    minimize_guesses = True
+    cache_dir = tempfile.mkdtemp()  # so that nothing is resumed or read from the tables of earlier runs
+    resume_runs = False
+    abcd = ['abcd' + x for x in ['e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm']]
+    # (optimize_for_winning, word list, {first guess: (wins, total guesses)}, (wins, total guesses) of the abcd words)
+    cases = [(False, abcd + ['dfhjl', 'egikm'], {'dfhjl': (11, 31), 'egikm': (11, 25)}, (11, 49)),
+             (False, abcd + ['egikm'], {'egikm': (10, 25)}, (10, 47)),
+             (True, abcd + ['dfhjl', 'egikm'], {'dfhjl': (11, 31), 'egikm': (11, 25)}, (8, 25)),
+             (True, abcd + ['egikm'], {'egikm': (10, 25)}, (7, 23))]
+    all_ok = True
+    for (endgame_max_candidates, use_closed_form) in [(saved[3], saved[4]), (0, False)]:
+        for (optimize_for_winning, words, expected, expected_abcd) in cases:
+            wordle_solutions = words
+            clear_tables()
+            run()
+            for g in init_state.alternative_next_guesses:
+                word = guess_candidates[g.word]
+                total_guesses = g.total_guesses[1] + g.wins[0]  # plus the first guess for each win
+                (wins, expected_total) = expected.get(word, expected_abcd)
+                ok = converged(g) and g.wins == (wins, wins) and total_guesses == expected_total
+                all_ok = all_ok and ok
+                print(word + ": " + str(total_guesses) + "/" + str(g.wins[0]) + " guesses" +
+                      ("" if ok else " but expected " + str(expected_total) + "/" + str(wins)))
+    shutil.rmtree(cache_dir)
+    (wordle_solutions, optimize_for_winning, minimize_guesses, endgame_max_candidates, use_closed_form,
+     cache_dir, resume_runs) = saved
+    clear_tables()
+    print("minimize_guesses test " + ("passed" if all_ok else "FAILED"))
+    return all_ok
+
+def test_minimax():
+    """
+    Check minimax_openers() on a synthetic word list where every first guess splits the other words into sets of
+    one.  The other word still takes a guess, so every first guess always wins in 2 guesses, not 1.
+    :return: whether all first guesses always win in exactly 2 guesses
+    """
+    global wordle_solutions
+    global cache_dir
+    saved = (wordle_solutions, cache_dir)
+    wordle_solutions = ['abcde', 'abcdf', 'fbcda']
+    cache_dir = tempfile.mkdtemp()  # so that nothing is read from the tables of earlier runs
+    clear_tables()
+    init_globals()
+    always_win = minimax_openers(processes=1, with_policies=True)
+    all_ok = True
+    for (word, (num_guesses, policy)) in always_win.items():
+        ok = num_guesses == 2 and all(num_guesses_left >= 1 for (num_guesses_left, cands) in policy)
+        all_ok = all_ok and ok
+        print(word + ": always wins in " + str(num_guesses) + " guesses" + ("" if ok else " but expected 2"))
+    shutil.rmtree(cache_dir)
+    (wordle_solutions, cache_dir) = saved
+    clear_tables()
+    print("minimax test " + ("passed" if all_ok else "FAILED"))
+    return all_ok
+
+def test_brute_force():
+    """
+    Check the wins and total guesses of every first guess found by the search against a brute force solution with
+    solve_endgame() on small word lists.  The endgame table, closed form, and initial bounds are turned off so that
+    every State is solved by the bounds of the search.  The guesses of these lists tie on wins in many States, where
+    the average number of guesses decides.
+    :return: whether all first guesses converged on the brute force values
+    """
+    global wordle_solutions
+    global endgame_max_candidates
+    global use_closed_form
+    global use_initial_bounds
+    global cache_dir
+    global resume_runs
+    saved = (wordle_solutions, endgame_max_candidates, use_closed_form, use_initial_bounds, cache_dir, resume_runs)
+    endgame_max_candidates = 0
+    use_closed_form = False
+    use_initial_bounds = False
+    cache_dir = tempfile.mkdtemp()  # so that nothing is resumed or read from the tables of earlier runs
+    resume_runs = False
+    ower = ['sower', 'power', 'lower', 'tower', 'cower', 'mower', 'rower']
+    cases = [ower + ['lusty', 'rusty', 'musty', 'gusty', 'dusty'],
+             ower + ['hatch', 'watch', 'catch', 'latch', 'patch', 'batch', 'match']]
+    all_ok = True
+    for words in cases:
+        wordle_solutions = words
+        clear_tables()
+        run()
+        endgame_table.clear()  # solve every set from scratch
+        for g in init_state.alternative_next_guesses:
+            wins = 0
+            total_guesses = 0
+            for (child, count) in compute_partition(all_solution_candidates, g.word):
+                if child == 0:
+                    wins += 1  # the guess is the solution
+                    total_guesses += 1
+                else:
+                    (child_wins, child_total_guesses, _) = solve_endgame(child, guesses_left(1, count))
+                    wins += child_wins
+                    total_guesses += child_total_guesses + child_wins
+            ok = converged(g) and g.wins == (wins, wins) and g.total_guesses[1] + g.wins[0] == total_guesses
+            all_ok = all_ok and ok
+            print(guess_candidates[g.word] + ": " + str(g.total_guesses[1] + g.wins[0]) + "/" + str(g.wins[0]) +
+                  " guesses" + ("" if ok else " but expected " + str(total_guesses) + "/" + str(wins)))
+    shutil.rmtree(cache_dir)
+    (wordle_solutions, endgame_max_candidates, use_closed_form, use_initial_bounds, cache_dir, resume_runs) = saved
+    clear_tables()
+    print("brute force test " + ("passed" if all_ok else "FAILED"))
+    return all_ok
+
 if __name__ == '__main__':
     # Execute when the module is not initialized from an import statement.
-    test()
+    if sys.argv[1:] == ['--json-lines']:
+        with contextlib.redirect_stdout(sys.stderr):  # keep the progress messages out of the answers
+            loaded = load_policy()
+        if not loaded:
+            print('no checkpoint of a policy for the word lists; run the search first', file=sys.stderr)
+            sys.exit(1)
+        serve_json_lines()
+    elif sys.argv[1:2] == ['--serve']:
+        serve(compiled='--compiled' in sys.argv)
+    elif sys.argv[1:2] == ['--load-test']:
+        load_test(*[int(a) for a in sys.argv[2:]])  # [number of requests [concurrency [port]]]
+    else:
+        test()